@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+times Sim900Thread's own code, against the fake Sim900 on its virtual
+clock (so the 0.8 s settling per bias costs nothing):
+
+	python benchmark.py results.json [baseline.json]
+
+sweeps of 10**2 up to 500**2 biases each run in a process of their own,
+and results.json gets points per second, the overhead per point and the
+peak memory of the process (None where the resource module is missing,
+ie on Windows), plus the exponents of how these grow with the number of
+points, in the same format as the mapper's benchmark.py; given a
+baseline.json the change in time per point is printed. Needs PySide;
+--sizes 10,50 limits the runs
+'''
+
+import os
+import sys
+import imp
+import json
+import time
+import numpy as np
+
+#the run and report code is shared with the mapper's benchmark.py
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),os.pardir,'mapper'))
+import benchmarking
+import fakesim900
+
+default_sizes = [10,20,50,100,200,500]
+default_targets = ['sim900thread']
+settings = {'sim900addr':'ASRL1','vsourcemod':2,'vmeasmod':7,'vsourceinput':1,'vmeasinput':2}
+
+def runCase(target,size):
+	#iv-gui.pyw is a script, so it is loaded by path, then given the fake
+	try:
+		gui = imp.load_source('iv_gui',os.path.join(os.path.dirname(os.path.abspath(__file__)),'iv-gui.pyw'))
+	except ImportError:
+		return None
+	gui.Sim900 = fakesim900.Sim900
+	fakesim900.simclock.clock.setVirtual(True)
+	fakesim900.Sim900.latency = 0.0
+	thread = gui.Sim900Thread(settings,list(np.linspace(-1,1,size*size)))
+	started = time.time()
+	thread.longRunning()
+	seconds = time.time()-started
+	return benchmarking.result(target,size,len(thread.queue),seconds,fakesim900.simclock.clock.elapsed())
+
+def main(argv):
+	if len(argv) == 4 and argv[1] == '--case':
+		print json.dumps(runCase(argv[2],int(argv[3])))
+		return 0
+	return benchmarking.main(argv,os.path.abspath(__file__),default_targets,default_sizes,__doc__)
+
+if __name__ == '__main__':
+	sys.exit(main(sys.argv))
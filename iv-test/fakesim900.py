@@ -3,13 +3,24 @@
 
 timeout = 500 #milliseconds
 print 'WARNING: YOU ARE USING THE FAKE SIM900'
+import os
+import sys
 import random
 
+#the simulation clock is the mapper's own, not a copy of it
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),os.pardir,'mapper'))
+import simclock
+#settling waits are only counted, not slept, with 'virtualclock' set
+
 class Sim900:
+	verbose = False #echo every command to stdout
+	latency = 0.0 #round trip per command (s)
+	noise = 0.4 #standard deviation of query results
 	def __init__(self,address):
 		'''
 		supply address (Sim900('ASRL1')) to connect to
 		'''
+		self.clock = simclock.clock
 		self.value = 5
 		if address == 'ASRL1':
 			self.device = True
@@ -21,19 +32,25 @@ class Sim900:
 
 
 	def write(self,module,command):
-		print 'CONN '+str(module)+', "xyxxz" ; '+str(command)+' ; xyxxz'
+		if self.verbose:
+			print 'CONN '+str(module)+', "xyxxz" ; '+str(command)+' ; xyxxz'
+		self.clock.sleep(self.latency)
 		try:
 			self.value = command[4:-2]
 		except IndexError:
 			self.value = 5
 
 	def read(self,module):
-		print 'CONN '+str(module)+', "xyxxz" ; READ_SOMETHING? ; xyxxz'
+		if self.verbose:
+			print 'CONN '+str(module)+', "xyxxz" ; READ_SOMETHING? ; xyxxz'
+		self.clock.sleep(self.latency)
 		return 'What were you expecting?'
 
 	def query(self,module,command):
-		print 'CONN '+str(module)+', "xyxxz" ; '+str(command)+' ; '+str(self.value)+' ; xyxxz'
-		return float(self.value) + random.gauss(0,0.4)
+		if self.verbose:
+			print 'CONN '+str(module)+', "xyxxz" ; '+str(command)+' ; '+str(self.value)+' ; xyxxz'
+		self.clock.sleep(self.latency)
+		return float(self.value) + random.gauss(0,self.noise)
 
 	def clear(self):
 		pass
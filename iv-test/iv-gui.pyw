@@ -12,6 +12,10 @@ import json
 import time
 import csv
 import os
+import collections
+#the simulation clock is the mapper's own, not a copy of it
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),os.pardir,'mapper'))
+import simclock
 #!!!!!!!!!!!!!!!!!
 from sim900 import Sim900
 #!!!!!!!!!!!!!!!!!
@@ -19,6 +23,7 @@ from matplotlib.backends.backend_qt4agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
 
 settings_file = 'settings.ini'
+refresh_interval = 50 #ms between GUI redraws while acquiring (20 Hz)
 
 def getSettings():
 	try:
@@ -36,6 +41,7 @@ def defaultSettings():
 				'vsourceinput':1,
 				'vmeasinput':2,
 				'tinput':3,
+				'virtualclock':False,
 				'export':{
 					'title':True,
 					'x_offset':True,
@@ -178,6 +184,9 @@ class IVProg(QtGui.QMainWindow):
 		#self.pbar.setGeometry(30,40,200,25)
 		#self.timer = QtCore.QTimer()
 		#self.timer.timeout.connect(self.timerEvent)
+		self.drain_timer = QtCore.QTimer(self)
+		self.drain_timer.setInterval(refresh_interval)
+		self.drain_timer.timeout.connect(self.drainData)
 		
 
 		#
@@ -316,6 +325,7 @@ class IVProg(QtGui.QMainWindow):
 
 		mainthing.setLayout(vbox)
 		self.settings = getSettings()
+		simclock.clock.setVirtual(self.settings.get('virtualclock',False))
 		#self.setGeometry(300,300,450,500)
 		self.resize(450,500)
 		self.name_of_application = 'I-V Tester'
@@ -523,12 +533,12 @@ class IVProg(QtGui.QMainWindow):
 					self.simThread = Sim900Thread(self.settings,self.biases)
 					self.simThread.moveToThread(self.objThread)
 					self.objThread.started.connect(self.simThread.longRunning)
-					self.simThread.newdata.connect(self.awaitData)
 					self.simThread.finished.connect(self.objThread.quit)
 					self.simThread.finished.connect(self.acquisitionFinished)
 					self.simThread.aborted.connect(self.resetPbar)
 					#self.halt_acquisition.connect(self.simThread.breakout)
 					self.objThread.start()
+					self.drain_timer.start()
 					print 'launched'
 					self.replot()
 				else:
@@ -542,14 +552,26 @@ class IVProg(QtGui.QMainWindow):
 			self.statusBar().showMessage('No valid bias range set!')
 
 	def acquisitionFinished(self):
+		self.drain_timer.stop()
+		self.drainData()
 		self.haltAction.setEnabled(False)
 		self.acquireAction.setEnabled(True)
 
-	def awaitData(self,data):
-		self.data = data
-		self.step += 1
-		self.pbar.setValue(100*(self.step/float(len(self.biases))))
-		self.replot()
+	def drainData(self):
+		#collects every reading the thread has queued since the last tick and redraws once
+		batch = 0
+		while True:
+			try:
+				v_source,v_meas = self.simThread.queue.popleft()
+			except IndexError:
+				break
+			self.data[0].append(v_source)
+			self.data[1].append(v_meas)
+			batch += 1
+		if batch > 0:
+			self.step += batch
+			self.pbar.setValue(100*(self.step/float(len(self.biases))))
+			self.replot()
 
 	#halt_acquisition = QtCore.Signal()
 	def halt(self):
@@ -590,6 +612,7 @@ class IVProg(QtGui.QMainWindow):
 
 	def receiveSettings(self):
 		self.settings = self.settingsWindow.settings
+		simclock.clock.setVirtual(self.settings.get('virtualclock',False))
 
 	def receivePlotSettings(self):
 		self.settings = self.plotSettingsWindow.settings
@@ -630,9 +653,9 @@ class Sim900Thread(QtCore.QObject):
 		self.biases = biases
 		self.settings = settings
 		self.abort = False
+		self.queue = collections.deque()
 		
 	finished = QtCore.Signal()
-	newdata = QtCore.Signal(list)
 	aborted = QtCore.Signal()
 
 	def longRunning(self):
@@ -642,7 +665,7 @@ class Sim900Thread(QtCore.QObject):
 		while self.step < len(self.biases) and self.abort == False:
 			self.setAndGetSimVoltages(self.biases[self.step])
 			self.step += 1
-			self.newdata.emit(self.data)
+			self.queue.append((self.data[0][-1],self.data[1][-1]))
 		if self.abort == True:
 			self.aborted.emit()
 		#print self.data
@@ -651,6 +674,8 @@ class Sim900Thread(QtCore.QObject):
 
 	def initSim(self):
 		self.sim = Sim900(self.settings['sim900addr'])
+		#the fake Sim900 brings its own (virtual) clock to settle by
+		self.clock = getattr(self.sim,'clock',time)
 		self.sim.write(self.settings['vsourcemod'],'OPON')
 
 	def closeSim(self):
@@ -659,7 +684,7 @@ class Sim900Thread(QtCore.QObject):
 
 	def setAndGetSimVoltages(self,biaspoint):
 		self.sim.write(self.settings['vsourcemod'],'VOLT '+str('%.3f' % biaspoint))
-		time.sleep(0.8)
+		self.clock.sleep(0.8)
 		self.data[0].append(float(self.sim.query(self.settings['vmeasmod'],'VOLT? '+str(self.settings['vsourceinput'])+',1')))
 		self.data[1].append(float(self.sim.query(self.settings['vmeasmod'],'VOLT? '+str(self.settings['vmeasinput'])+',1')))
 
@@ -1086,6 +1111,8 @@ class IVSettings(QtGui.QMainWindow):
 		self.vmeasmod = QtGui.QLineEdit(str(self.settings['vmeasmod']))
 		self.vsourceinput = QtGui.QLineEdit(str(self.settings['vsourceinput']))
 		self.vmeasinput = QtGui.QLineEdit(str(self.settings['vmeasinput']))
+		self.virtualclock = QtGui.QCheckBox('Virtual clock (fake SIM900 only)')
+		self.virtualclock.setChecked(self.settings.get('virtualclock',False))
 		self.ok = QtGui.QPushButton('OK')
 		self.cancel = QtGui.QPushButton('Cancel')
 		self.cancel.clicked.connect(self.close)
@@ -1110,8 +1137,10 @@ class IVSettings(QtGui.QMainWindow):
 		self.grid.addWidget(QtGui.QLabel('\tMeasured voltage channel:'),8,0)
 		self.grid.addWidget(self.vmeasinput,8,1)
 		self.grid.setRowMinimumHeight(9,10)
-		self.grid.addWidget(self.ok,10,0)
-		self.grid.addWidget(self.cancel,10,1)
+		self.grid.addWidget(self.virtualclock,10,0,1,2)
+		self.grid.setRowMinimumHeight(11,10)
+		self.grid.addWidget(self.ok,12,0)
+		self.grid.addWidget(self.cancel,12,1)
 
 		self.vbox = QtGui.QVBoxLayout()
 		self.vbox.addLayout(self.grid)
@@ -1133,6 +1162,7 @@ class IVSettings(QtGui.QMainWindow):
 		self.settings['vmeasinput'] = int(self.vmeasinput.text())
 		self.settings['vsourceinput'] = int(self.vsourceinput.text())
 		self.settings['tinput'] = int(self.tinput.text())
+		self.settings['virtualclock'] = self.virtualclock.isChecked()
 		self.close()
 
 class IVPlotSettings(QtGui.QMainWindow):
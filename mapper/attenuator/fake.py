@@ -4,12 +4,17 @@
 timeout = 500 #milliseconds
 import random
 
+from simclock import clock
+
 class Attenuator:
+	verbose = False #echo every command to stdout
+	latency = 0.0 #round trip per command (s)
 	def __init__(self,address):
 		'''
 		supply address (Sim900('ASRL1')) to connect to
 		'''
 		print 'WARNING: YOU ARE USING THE FAKE ATTENUATOR'
+		self.clock = clock
 		self.value = 20
 		if address == 'ASRL1':
 			self.device = True
@@ -21,7 +26,9 @@ class Attenuator:
 
 
 	def write(self,command):
-		print str(command)
+		if self.verbose:
+			print str(command)
+		self.clock.sleep(self.latency)
 		try:
 			self.value = command[4:-2]
 		except IndexError:
@@ -31,7 +38,9 @@ class Attenuator:
 		return 'What were you expecting?'
 
 	def query(self,command):
-		print str(command)
+		if self.verbose:
+			print str(command)
+		self.clock.sleep(self.latency)
 		return float(self.value)
 
 	def clear(self):
@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+times the scan code itself, against fake instruments that take no time:
+
+	python benchmark.py results.json [baseline.json]
+
+each target runs one scanner map (lock-in reflection) of 10x10 up to
+500x500 points in a process of its own, and results.json gets, per run,
+points per second, the overhead per point (all of it is the program's,
+as the instruments cost nothing) and the peak memory of the process
+(None where the resource module is missing, ie on Windows), plus for
+each target the exponent of how time and memory grow with the number of
+points (1 is linear). Given a baseline.json from an earlier version, the
+change in time per point is printed for the runs both have.
+
+targets:
+	engine		ScanEngine, with the dataset and rescue journal it writes
+	mapperdrone	MapperDrone, ie the same plus its Qt signals
+	scandrone	one frame of MapperTool's ScanDrone
+	journal		the rescue journal on its own, a record per point
+	preview		MapperProg's live preview, fed a row per drain tick
+
+the drones and the preview need PySide (the preview also a display);
+targets that cannot be loaded are left out, and --sizes 10,50 (grid
+sides) or --targets engine limit the runs
+'''
+
+import os
+import sys
+import imp
+import json
+import time
+import tempfile
+import numpy as np
+
+import benchmarking
+import simclock
+import movement
+import measurement
+from engine import ScanEngine, findDevices
+from dataset import MapperDataset
+from journal import Journal
+
+default_sizes = [10,20,50,100,200,500]
+default_targets = ['engine','mapperdrone','scandrone','journal','preview']
+devices = {'scannertype':'fakescanner','reflectype':'fakereflec','countertype':'fakecounter','motortype':'fakemotor'}
+#a power of two, so the grid sides come out exact
+step = 2**-6
+
+def zeroLatency():
+	#instruments that answer at once, on a clock that never really waits
+	simclock.clock.setVirtual(True)
+	movement.FakeScanner.move_latency = 0.0
+	measurement.FakeLockIn.latency = 0.0
+
+def scanParameters(size):
+	meas_par = {'mtype':'sr','xf':0.0,'xt':(size-1)*step,'yf':0.0,'yt':(size-1)*step,
+				'xv':step,'yv':step,'tm':0.0,'tp':0.0,
+				'serpentine':False,'adaptive':False,'pipelined':False}
+	findDevices(meas_par,devices)
+	return meas_par
+
+def loadGui():
+	#mapper.pyw is a script, so it is loaded by path; None without PySide
+	try:
+		return imp.load_source('mapper_gui',os.path.join(os.path.dirname(os.path.abspath(__file__)),'mapper.pyw'))
+	except ImportError:
+		return None
+
+class OneFrame(measurement.FakeLockIn):
+	#ScanDrone repeats its map until halted; this halts it after one frame
+	left = 0
+	drone = None
+	def getMeasurement(self):
+		OneFrame.left -= 1
+		if OneFrame.left <= 0:
+			OneFrame.drone.abort = True
+		return measurement.FakeLockIn.getMeasurement(self)
+
+def runEngine(size,drone_class=ScanEngine):
+	meas_par = scanParameters(size)
+	dataset = MapperDataset()
+	journal_file = tempfile.NamedTemporaryFile(suffix='.jsonl',delete=False)
+	journal_file.close()
+	journal = Journal(journal_file.name,{'meas_par':None},10)
+	dataset.setJournal(journal)
+	scan = drone_class(meas_par,dataset)
+	started = time.time()
+	scan.runScan()
+	seconds = time.time()-started
+	journal.close()
+	os.remove(journal_file.name)
+	return len(dataset), seconds
+
+def runScanDrone(size,gui):
+	sMeas_par = {'mtype':'usr','xf':0.0,'xt':(size-1)*step,'yf':0.0,'yt':(size-1)*step,
+				 'xv':step,'yv':step,'tm':0.0,'tp':0.0,
+				 'mover':movement.FakeScanner,'measurer':OneFrame}
+	drone = gui.ScanDrone(sMeas_par)
+	OneFrame.left = size*size
+	OneFrame.drone = drone
+	started = time.time()
+	drone.runScan()
+	seconds = time.time()-started
+	return len(drone.queue), seconds
+
+def runJournal(size):
+	#the rescue journal alone, given the points as the dataset would
+	rows = [[i*step,j*step,i,j,0.0] for j in range(size) for i in range(size)]
+	journal_file = tempfile.NamedTemporaryFile(suffix='.jsonl',delete=False)
+	journal_file.close()
+	journal = Journal(journal_file.name,{'meas_par':None},10)
+	started = time.time()
+	for row in rows:
+		journal.record(row,started)
+	journal.close()
+	seconds = time.time()-started
+	os.remove(journal_file.name)
+	return len(rows), seconds
+
+#MapperProg's preview code, run on a stand-in with only the state it uses
+preview_methods = ['drainData','addToPreview','showPreview','paintPreview','previewExtent','updatePreviewGrid']
+
+def runPreview(size,gui):
+	'''
+	the time MapperProg's drain timer spends drawing a map that arrives a
+	row per tick; the appends in between are the drone's, so not counted
+	'''
+	methods = dict((name,gui.MapperProg.__dict__[name]) for name in preview_methods)
+	methods['showProgress'] = lambda self: None
+	#the canvas is a Qt widget, so needs an application
+	app = gui.QtGui.QApplication.instance() or gui.QtGui.QApplication(sys.argv)
+	host = type('PreviewHost',(object,),methods)()
+	host.meas_par = scanParameters(size)
+	host.data = MapperDataset()
+	host.x_steps = size
+	host.y_steps = size
+	host.x_forward = True
+	host.y_forward = True
+	host.shown = 0
+	host.preview = None
+	host.drawn = 0
+	host.fig = gui.plt.figure('preview',figsize = (4.5,4), dpi=72)
+	host.ax = host.fig.add_subplot(1,1,1)
+	host.canvas = gui.FigureCanvas(host.fig)
+	#noisy, so the colour limits keep widening as they would on a real map
+	values = np.random.normal(-0.8,0.1,size*size)
+	seconds = 0.0
+	for j in range(size):
+		for i in range(size):
+			host.data.append([i*step,j*step,i,j,values[j*size+i]])
+		started = time.time()
+		host.drainData()
+		seconds += time.time()-started
+	return len(host.data), seconds
+
+def runCase(target,size):
+	'''
+	one run, in this process; returns its result, or None if the target
+	cannot be loaded here
+	'''
+	zeroLatency()
+	if target == 'engine':
+		points, seconds = runEngine(size)
+	elif target == 'journal':
+		points, seconds = runJournal(size)
+	else:
+		gui = loadGui()
+		if gui == None:
+			return None
+		if target == 'mapperdrone':
+			points, seconds = runEngine(size,gui.MapperDrone)
+		elif target == 'scandrone':
+			points, seconds = runScanDrone(size,gui)
+		elif target == 'preview':
+			points, seconds = runPreview(size,gui)
+	return benchmarking.result(target,size,points,seconds,simclock.clock.elapsed())
+
+def main(argv):
+	if len(argv) == 4 and argv[1] == '--case':
+		#a single run, reported back to the parent process
+		print json.dumps(runCase(argv[2],int(argv[3])))
+		return 0
+	return benchmarking.main(argv,os.path.abspath(__file__),default_targets,default_sizes,__doc__)
+
+if __name__ == '__main__':
+	sys.exit(main(sys.argv))
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+what the mapper's and iv-test's benchmark.py share: every run is timed in
+a process of its own (the script run with --case target size), reported
+as one dict, and results.json gets the runs, how each target scales with
+the number of points and the versions it was run on; a baseline.json
+from an earlier version is compared against run by run
+'''
+
+import sys
+import json
+import time
+import subprocess
+import numpy as np
+
+try:
+	import resource
+except ImportError:
+	resource = None
+
+def peakMemory():
+	'''
+	peak memory of this process in kB, or None where the resource module
+	is missing (ie on Windows)
+	'''
+	if resource == None:
+		return None
+	#kilobytes on Linux, bytes on Mac OS
+	peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	if sys.platform == 'darwin':
+		peak_memory /= 1024
+	return peak_memory
+
+def result(target,size,points,seconds,instrument_seconds):
+	'''
+	one run as reported to the parent process and saved
+	'''
+	return {'target':target,
+			'size':size,
+			'points':points,
+			'seconds':seconds,
+			'points_per_second':points/seconds,
+			'overhead_per_point':seconds/points,
+			'peak_memory_kb':peakMemory(),
+			'instrument_seconds':instrument_seconds}
+
+def scaling(runs,key):
+	#exponent of key against the number of points, from a log-log fit
+	runs = [run for run in runs if run[key] != None and run[key] > 0]
+	if len(runs) < 2:
+		return None
+	return np.polyfit(np.log([run['points'] for run in runs]),np.log([run[key] for run in runs]),1)[0]
+
+def compare(results,baseline):
+	before = dict(((run['target'],run['size']),run) for run in baseline['runs'])
+	for run in results['runs']:
+		if (run['target'],run['size']) in before:
+			old = before[(run['target'],run['size'])]['overhead_per_point']
+			print '%-12s %4dx%-4d %8.1f us/point (%+.0f%%)' % (run['target'],run['size'],run['size'],
+				run['overhead_per_point']*1e6,100*(run['overhead_per_point']/old-1))
+
+def option(argv,name,default):
+	if name in argv:
+		value = argv[argv.index(name)+1]
+		del argv[argv.index(name):argv.index(name)+2]
+		return value.split(',')
+	return default
+
+def main(argv,script,targets,sizes,usage):
+	'''
+	runs script once per target and size (--targets and --sizes narrow
+	them), writes argv[1] and compares against argv[2] if given; targets
+	whose case reports None cannot be loaded here, and are skipped
+	'''
+	argv = list(argv)
+	sizes = [int(size) for size in option(argv,'--sizes',sizes)]
+	targets = option(argv,'--targets',targets)
+	if len(argv) not in [2,3]:
+		print usage
+		return 1
+
+	results = {'python':sys.version,
+			   'platform':sys.platform,
+			   'numpy':np.__version__,
+			   'dateandtime':time.asctime(),
+			   'runs':[],
+			   'scaling':{}}
+	for target in targets:
+		runs = []
+		for size in sizes:
+			#a process per run, so the peak memory is the run's own
+			output = subprocess.check_output([sys.executable,script,'--case',target,str(size)])
+			run = json.loads(output.strip().splitlines()[-1])
+			if run == None:
+				print target+' cannot be loaded here (needs PySide), skipped'
+				break
+			print '%-12s %4dx%-4d %10.0f points/s %8.1f us/point' % (target,size,size,run['points_per_second'],run['overhead_per_point']*1e6)
+			runs.append(run)
+		results['runs'] += runs
+		if runs != []:
+			results['scaling'][target] = {'seconds':scaling(runs,'seconds'),
+										  'peak_memory_kb':scaling(runs,'peak_memory_kb')}
+	with open(argv[1],'w') as f:
+		f.write(json.dumps(results,indent=1))
+	if len(argv) == 3:
+		with open(argv[2],'r') as f:
+			compare(results,json.loads(f.read()))
+	return 0
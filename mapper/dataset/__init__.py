@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import numpy as np
+
+columns = ['x','y','i','j','value']
+
+class MapperDataset:
+	'''
+	points of a map, kept in a preallocated structured array
+	(x, y, i, j, value, timestamp, dwell) that doubles in size when full,
+	so appending is amortised O(1); column() returns views rather than
+	copies
+
+	maps read with several detectors have one value column per channel:
+	'value' for the main one, then 'value1', 'value2', ...; the number of
+	channels is taken from the rows given, if not stated
+	'''
+	def __init__(self,rows=None,timestamps=None,dwells=None,capacity=1024,channels=None):
+		if channels == None:
+			channels = len(rows[0])-4 if rows else 1
+		self.channels = channels
+		self.extra = ['value'+str(k) for k in range(1,channels)]
+		self.dtype = np.dtype([('x',float),('y',float),('i',int),('j',int),('value',float),('timestamp',float),('dwell',float)]+
+							  [(name,float) for name in self.extra])
+		self.points = np.zeros(max(capacity,1),dtype=self.dtype)
+		self.count = 0
+		self.journal = None
+		if rows != None:
+			self.extend(rows,timestamps,dwells)
+
+	def __len__(self):
+		return self.count
+
+	def append(self,row,timestamp=None,dwell=None):
+		'''
+		adds one point given as [x, y, i, j, value] (with a value for each
+		further channel after it); dwell is the time (s) the measurer
+		actually spent on it, if it decides that itself
+		'''
+		if self.count == len(self.points):
+			self.grown = np.zeros(2*len(self.points),dtype=self.dtype)
+			self.grown[:self.count] = self.points[:self.count]
+			self.points = self.grown
+		if timestamp == None:
+			timestamp = time.time()
+		self.points[self.count] = (row[0],row[1],int(row[2]),int(row[3]),row[4],timestamp,np.nan if dwell == None else dwell)+tuple(row[5:5+len(self.extra)])
+		#count last, so readers on other threads only see complete points
+		self.count += 1
+		if self.journal != None:
+			self.journal.record(row,timestamp,dwell)
+
+	def extend(self,rows,timestamps=None,dwells=None):
+		for n, row in enumerate(rows):
+			self.append(row,
+						timestamps[n] if timestamps != None else None,
+						dwells[n] if dwells != None else None)
+
+	def setJournal(self,journal):
+		'''
+		journal.record(row, timestamp, dwell) is called for every point appended
+		from now on; None to stop
+		'''
+		self.journal = journal
+
+	def column(self,name):
+		'''
+		view of one field ('x', 'y', 'i', 'j', 'value', 'timestamp' or 'dwell')
+		'''
+		return self.points[name][:self.count]
+
+	def channel(self,k):
+		'''
+		view of the values of channel k (0 being the main one)
+		'''
+		if k == 0:
+			return self.column('value')
+		return self.column(self.extra[k-1])
+
+	def dwells(self):
+		'''
+		dwell of each point as saved to file (None where there is none),
+		or None if no point has one
+		'''
+		dwell = self.column('dwell')
+		if np.isnan(dwell).all():
+			return None
+		return [None if d != d else d for d in dwell.tolist()]
+
+	def tolist(self):
+		'''
+		[x, y, i, j, value, ...] rows, as saved to file
+		'''
+		return self.since(0)
+
+	def since(self,start):
+		'''
+		[x, y, i, j, value, ...] rows from index start onwards; safe to
+		call while the acquisition thread is still appending
+		'''
+		stop = self.count
+		return [list(row) for row in self.points[start:stop][columns+self.extra].tolist()]
@@ -0,0 +1,586 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import inspect
+import numpy as np
+
+import movement
+import measurement
+import pipeline
+from dataset import MapperDataset
+
+#buffer samples taken per pixel in fly scans
+fly_samples = 4
+#DEVICES entry naming the driver for each detector channel
+channel_devices = {'r':'reflectype','c':'countertype'}
+
+def channelsOf(meas_par):
+	'''
+	detector channels a map reads ('r' reflection, 'c' counts), the main
+	one (whose letter is in mtype) first
+	'''
+	if meas_par.get('channels'):
+		return list(meas_par['channels'])
+	return [x for x in 'rc' if x in meas_par['mtype']][:1]
+
+def channelTimes(meas_par,channel):
+	'''
+	(measurement, pause) times of one channel: tm/tp for the main one,
+	tm_<channel>/tp_<channel> for the others
+	'''
+	if channel == channelsOf(meas_par)[0]:
+		return meas_par['tm'], meas_par['tp']
+	return meas_par['tm_'+channel], meas_par['tp_'+channel]
+
+def zPositions(meas_par):
+	'''
+	z of each plane of a z-stack, from zf to zt
+	'''
+	return list(np.linspace(meas_par['zf'],meas_par['zt'],int(meas_par['zn'])))
+
+def deviceName(device):
+	#driver class name, whether given the class or an open instance
+	if inspect.isclass(device):
+		return device.__name__
+	return device.__class__.__name__
+
+def findDevices(meas_par,devices):
+	'''
+	puts the mover/measurer classes for meas_par['mtype'] into meas_par,
+	from a DEVICES block as in settings.json; returns an error message,
+	or None if they suit the scan. meas_par['measurers'] gets one class
+	per channel, the first also being meas_par['measurer']
+	'''
+	if 'm' in meas_par['mtype'] or 'M' in meas_par['mtype']:
+		meas_par['mover'] = movement.findClass(devices['motortype'])
+	elif 's' in meas_par['mtype']:
+		meas_par['mover'] = movement.findClass(devices['scannertype'])
+
+	meas_par['measurers'] = [measurement.findClass(devices[channel_devices[channel]]) for channel in channelsOf(meas_par)]
+	meas_par['measurer'] = meas_par['measurers'][0]
+
+	if not any(x in meas_par['mover'].devicetype for x in meas_par['mtype']):
+		return 'Movement device different type from expected! Check settings. Aborting...'
+	if not any(x in meas_par['measurer'].devicetype for x in meas_par['mtype']):
+		return 'Measurement device different type from expected! Check settings. Aborting...'
+	for channel, measurer in zip(channelsOf(meas_par),meas_par['measurers']):
+		if channel not in measurer.devicetype:
+			return 'Measurement device different type from expected! Check settings. Aborting...'
+	return None
+
+def checkLimits(meas_par):
+	'''
+	checks meas_par against the tests tables of its mover and measurers
+	(and the adaptive, precision, averaging and z-stack settings); returns an
+	error message, or None
+	'''
+	tests = {}
+	for item in ['mover','measurer']:
+		for key in meas_par[item].tests.keys():
+			tests[key] = meas_par[item].tests[key]
+	if meas_par.get('adaptive'):
+		tests['adaptive'] = [[['levels'],[1,6],'Adaptive levels out of bounds'],
+							 [['threshold'],[0,1],'Adaptive threshold out of bounds'],
+							 [['maxpoints'],[1,float('inf')],'Adaptive point budget out of bounds']]
+
+	channels = channelsOf(meas_par)
+	measurers = meas_par.get('measurers',[meas_par['measurer']])
+	if meas_par.get('precision') and 'c' in channels:
+		counter = measurers[channels.index('c')]
+		if not hasattr(counter,'setPrecision'):
+			return 'Counting to a precision needs a counter that can count in sub-gates'
+		if not (0 <= meas_par['precision'] <= 1):
+			return 'Precision out of bounds: '+str(meas_par['precision'])+' outside limits 0, 1'
+		if channelTimes(meas_par,'c')[0] < counter.subgate:
+			return 'Measurement time shorter than one sub-gate: '+str(channelTimes(meas_par,'c')[0])+' below '+str(counter.subgate)
+	if meas_par.get('gates',1) > 1 and 'c' in channels:
+		if not hasattr(measurers[channels.index('c')],'setAveraging'):
+			return 'Averaging gates needs a counter that can take several gates on one trigger'
+		if meas_par.get('precision'):
+			return 'Averaging gates and counting to a precision cannot be combined'
+		if not (1 <= meas_par['gates'] <= 1000):
+			return 'Gates per point out of bounds: '+str(meas_par['gates'])+' outside limits 1, 1000'
+	if meas_par.get('samples',1) > 1 and 'r' in channels:
+		lockin = measurers[channels.index('r')]
+		if not hasattr(lockin,'setAveraging'):
+			return 'Averaging samples needs a lock-in with a curve buffer'
+		if not (1 <= meas_par['samples'] <= 1000):
+			return 'Samples per point out of bounds: '+str(meas_par['samples'])+' outside limits 1, 1000'
+		if channelTimes(meas_par,'r')[0] < meas_par['samples']*lockin.curve_interval:
+			return 'Measurement time too short for '+str(meas_par['samples'])+' samples, '+str(lockin.curve_interval)+' s apart'
+
+	#detectors other than the main one are checked against their own tests
+	for channel, measurer in zip(channels[1:],measurers[1:]):
+		times = dict(zip(['tm','tp'],channelTimes(meas_par,channel)))
+		for test in measurer.tests.get(channel,[]):
+			for key in test[0]:
+				if key in times and not (test[1][0] <= times[key] <= test[1][1]):
+					return test[2]+': '+str(times[key])+' outside limits '+str(test[1][0])+', '+str(test[1][1])
+
+	if meas_par.get('zstack'):
+		if 'z' not in meas_par['mover'].axes:
+			return 'Z stacks need a mover with a z axis'
+		if 'm' in meas_par['mtype'] or meas_par.get('adaptive') or meas_par.get('fly'):
+			return 'Z stacks repeat plain closed-loop or scanner maps only'
+		tests['zstack'] = tests.get('zstack',[])+[[['zn'],[2,1000],'Number of z planes out of bounds']]
+
+	if meas_par.get('fly'):
+		if not ('s' in meas_par['mtype'] and 'r' in meas_par['mtype'] and hasattr(meas_par['mover'],'flyRow')):
+			return 'Fly scans need a scanner that can sweep while buffering reflection readings'
+		if meas_par.get('adaptive'):
+			return 'Fly scans cannot use adaptive refinement'
+		if len(channels) > 1:
+			return 'Fly scans read the lock-in buffer only, not several detectors'
+
+	for test_set in tests.keys():
+		if test_set in meas_par['mtype'] or test_set == 'adaptive' or (test_set == 'zstack' and meas_par.get('zstack')):
+			for test in tests[test_set]:
+				for key in test[0]:
+					if not (test[1][0] <= meas_par[key] <= test[1][1]):
+						return test[2]+': '+str(meas_par[key])+' outside limits '+str(test[1][0])+', '+str(test[1][1])
+	return None
+
+class ScanEngine:
+	'''
+	runs a map described by meas_par (as built by MapperProg) into a
+	MapperDataset, with no GUI; progress is reported through the hook
+	methods at the end, which do nothing here and are overridden by
+	MapperDrone (as Qt signals) and the headless runner
+	'''
+	def __init__(self,meas_par,dataset=None,volume=None):
+		self.abort = False
+		self.meas_par = meas_par
+		self.volume = volume
+		self.plane = 0
+		self.latency = {'move':[0.0,0],'readout':[0.0,0]}
+		if dataset == None:
+			dataset = MapperDataset()
+		self.dataset = dataset
+
+	def runScan(self):
+		self.init() #readies mover/measurer
+		if not self.meas_par.get('resume'):
+			self.mover.moveToXY(self.meas_par['xf'],self.meas_par['yf'])
+		#print 'homed to:',self.mover.getPos()
+		self.xgoesup = self.meas_par['xt'] > self.meas_par['xf']
+		self.ygoesup = self.meas_par['yt'] > self.meas_par['yf']
+		#with several detectors each reads on its own I/O worker, so they
+		#read at the same time; devices sharing an address share a worker,
+		#the mover's included (it only uses its own when pipelining)
+		self.read_workers = None
+		if self.meas_par['pipelined'] or len(self.measurers) > 1:
+			self.workers = pipeline.workersFor(self.mover,*self.measurers)
+			self.move_worker, self.read_workers = self.workers[0], self.workers[1:]
+		try:
+			if self.meas_par.get('zstack'):
+				self.runZStack()
+			elif 's' in self.meas_par['mtype'] and self.meas_par.get('fly'):
+				self.runFlyMap()
+			elif ('M' in self.meas_par['mtype'] or 's' in self.meas_par['mtype']) and self.meas_par['adaptive']:
+				self.runAdaptiveMap()
+			elif ('M' in self.meas_par['mtype'] or 's' in self.meas_par['mtype']) and self.meas_par['pipelined']:
+				self.runPipelinedClosedLoopMap()
+			elif 'M' in self.meas_par['mtype'] or 's' in self.meas_par['mtype']:
+				self.runClosedLoopMap()
+			elif 'm' in self.meas_par['mtype']:
+				self.runOpenLoopMap()
+		finally:
+			if self.read_workers != None:
+				for worker in set(self.workers):
+					worker.stop()
+
+		self.mover.moveToXY(self.meas_par['xf'],self.meas_par['yf'])
+		#devices that came in open, or are wanted for the next job of a
+		#session, are left for the caller to close
+		if not self.meas_par.get('session'):
+			for device in self.owned:
+				device.close()
+		self.scanFinished()
+
+	def runZStack(self):
+		#the same map at each z in turn, each plane into its own slice of
+		#the volume (the dataset gets every point, plane after plane)
+		for self.plane, z in enumerate(zPositions(self.meas_par)):
+			self.mover.moveTo('z',z)
+			self.planeStarted(self.plane,z)
+			if self.meas_par['pipelined']:
+				self.runPipelinedClosedLoopMap()
+			else:
+				self.runClosedLoopMap()
+			if self.volume != None:
+				self.volume.flush()
+			if self.abort == True:
+				break
+		self.mover.moveTo('z',self.meas_par['zf'])
+
+	def runClosedLoopMap(self):
+		self.points = self.scanOrder()
+		self.current_row = None
+		for k, (i, j, x_step, y_step) in enumerate(self.points):
+			self.visitPoint(i,j,x_step,y_step)
+			if k+1 == len(self.points) or self.points[k+1][1] != j:
+				self.rowDone()
+			if self.abort == True:
+				self.scanAborted()
+				return
+
+	def visitPoint(self,i,j,x_step,y_step):
+		#points already in the dataset (a resumed map) are not measured again
+		if (i,j) in self.done:
+			return self.done[(i,j)]
+		return self.measurePoint(i,j,x_step,y_step)
+
+	def measurePoint(self,i,j,x_step,y_step):
+		self.started = time.time()
+		self.moveToPoint(i,j,x_step,y_step)
+		self.setMoveTime(time.time())
+		self.pos = self.mover.getPos()
+		self.read_from = time.time()
+		self.values = self.readMeasurers()
+		self.meas = self.values[0]
+		self.addLatency('move',self.read_from-self.started)
+		self.addLatency('readout',time.time()-self.read_from-self.readTime())
+		self.point = [self.pos['x'],self.pos['y'],i,j]+self.values
+		self.storePoint(self.point)
+		return self.meas
+
+	def storePoint(self,point):
+		self.dataset.append(point,dwell=self.pointDwell())
+		if self.volume != None:
+			self.volume.write(self.plane,point[3],point[2],point[4:])
+
+	def setMoveTime(self,moved_at):
+		for measurer in self.measurers:
+			measurer.setMoveTime(moved_at)
+
+	def submitReadings(self):
+		#starts every detector reading at once
+		return [worker.submit(measurer.getMeasurement) for worker, measurer in zip(self.read_workers,self.measurers)]
+
+	def gatedReading(self,measurer,gate):
+		#a reading that sets gate when the detector's gate closes (or, at
+		#the latest, when the reading is done, eg if it raised)
+		measurer.gateClosed = gate.set
+		try:
+			return measurer.getMeasurement()
+		finally:
+			gate.set()
+			measurer.gateClosed = None
+
+	def readMeasurers(self):
+		#a value per channel, main one first
+		if self.read_workers == None:
+			return [self.measurer.getMeasurement()]
+		return [reading.result() for reading in self.submitReadings()]
+
+	def readTime(self):
+		#how long the last readings were meant to take (pause plus measurement
+		#time, for the slowest detector); counters set to a precision choose
+		#their own measurement time
+		self.read_time = 0.0
+		for channel, measurer in zip(self.channels,self.measurers):
+			tm, tp = channelTimes(self.meas_par,channel)
+			if measurer.dwell != None:
+				tm = measurer.dwell
+			self.read_time = max(self.read_time,tm+tp)
+		return self.read_time
+
+	def pointDwell(self):
+		#dwell chosen by a counter set to a precision, if one was read
+		for measurer in self.measurers:
+			if measurer.dwell != None:
+				return measurer.dwell
+		return None
+
+	def addLatency(self,phase,seconds):
+		#running [total, count] per phase, for the duration planner
+		self.latency[phase][0] += seconds
+		self.latency[phase][1] += 1
+
+	def scanOrder(self,stride=1):
+		#(i, j, x, y) for every stride'th point, in the order they are visited
+		self.points = []
+		for row, j in enumerate(range(0,len(self.y_steplist),stride)):
+			self.x_order = range(0,len(self.x_steplist),stride)
+			#serpentine maps scan odd rows backwards, saving the fly-back
+			if self.meas_par['serpentine'] and row % 2 == 1:
+				self.x_order.reverse()
+			for i in self.x_order:
+				self.points.append((i,j,self.x_steplist[i],self.y_steplist[j]))
+		return self.points
+
+	def runFlyMap(self):
+		#sweeps x across each row while the scanner buffers readings at a fixed
+		#rate, then bins the samples into the row's pixels by their position;
+		#tm is the time per pixel, tp the settling time before each sweep
+		self.row_time = self.meas_par['tm']*len(self.x_steplist)
+		self.interval = max(self.mover.fly_interval,self.meas_par['tm']/fly_samples)
+		self.done_rows = set(j for i, j in self.done.keys())
+		for row, y_step in enumerate(self.y_steplist):
+			if row in self.done_rows:
+				continue
+			self.x_order = [0,len(self.x_steplist)-1]
+			if self.meas_par['serpentine'] and row % 2 == 1:
+				self.x_order.reverse()
+			self.mover.moveToXY(self.x_steplist[self.x_order[0]],y_step)
+			self.mover.clock.sleep(self.meas_par['tp'])
+			self.positions, self.samples = self.mover.flyRow('x',self.x_steplist[self.x_order[0]],
+															 self.x_steplist[self.x_order[1]],self.row_time,self.interval)
+			self.pos = self.mover.getPos()
+			#nearest pixel of each sample; a single column takes them all
+			if len(self.x_steplist) < 2 or self.x_steplist[-1] == self.x_steplist[0]:
+				self.pixels = np.zeros(len(self.positions))
+			else:
+				self.pixels = np.rint((self.positions-self.x_steplist[0])/(self.x_steplist[-1]-self.x_steplist[0])*(len(self.x_steplist)-1))
+			self.pixels = np.clip(self.pixels,0,len(self.x_steplist)-1).astype(int)
+			for i in range(len(self.x_steplist))[::1 if self.x_order[0] == 0 else -1]:
+				self.in_pixel = self.pixels == i
+				if self.in_pixel.any():
+					self.point = [self.positions[self.in_pixel].mean(),self.pos['y'],i,row,self.samples[self.in_pixel].mean()]
+					self.dataset.append(self.point)
+			self.rowDone()
+			if self.abort == True:
+				self.scanAborted()
+				return
+
+	def runAdaptiveMap(self):
+		#measures the coarse grid, then splits each cell whose corners differ
+		#by more than threshold*(range of values so far) into four, measuring
+		#the new edge and centre points; the biggest differences are refined
+		#first, until the cells are one lattice step or the budget is spent.
+		#(corner spread also bounds the corner variance, so one test does both)
+		self.size = 2**self.meas_par['levels']
+		self.measured = {}
+		self.current_row = None
+		self.points = self.scanOrder(self.size)
+		for k, (i, j, x_step, y_step) in enumerate(self.points):
+			self.measured[(i,j)] = self.visitPoint(i,j,x_step,y_step)
+			if k+1 == len(self.points) or self.points[k+1][1] != j:
+				self.rowDone()
+			if self.abort == True:
+				self.scanAborted()
+				return
+		self.cells = [(i,j) for i, j, x_step, y_step in self.points
+					  if (i+self.size,j+self.size) in self.measured]
+		while self.size > 1:
+			self.span = max(self.measured.values()) - min(self.measured.values())
+			self.scored = []
+			for i, j in self.cells:
+				self.corners = [self.measured[(i+di,j+dj)] for di in (0,self.size) for dj in (0,self.size)]
+				self.spread = max(self.corners) - min(self.corners)
+				if self.span > 0 and self.spread > self.meas_par['threshold']*self.span:
+					self.scored.append((self.spread,i,j))
+			self.scored.sort(reverse=True)
+			self.half = self.size//2
+			self.new_cells = []
+			self.new_points = set()
+			for spread, i, j in self.scored:
+				self.needed = set([(i+self.half,j),(i,j+self.half),(i+self.half,j+self.half),
+								   (i+self.size,j+self.half),(i+self.half,j+self.size)])
+				self.needed = self.needed - self.new_points - set(self.measured.keys())
+				if len(self.measured)+len(self.new_points)+len(self.needed) > self.meas_par['maxpoints']:
+					break
+				self.new_points |= self.needed
+				self.new_cells += [(i,j),(i+self.half,j),(i,j+self.half),(i+self.half,j+self.half)]
+			if self.new_cells == []:
+				break
+			#visit the new points row by row, alternating direction
+			self.rows = sorted(set(j for i, j in self.new_points))
+			for row, j in enumerate(self.rows):
+				self.row_points = sorted(i for i, jj in self.new_points if jj == j)
+				if row % 2 == 1:
+					self.row_points.reverse()
+				for i in self.row_points:
+					self.measured[(i,j)] = self.visitPoint(i,j,self.x_steplist[i],self.y_steplist[j])
+					if self.abort == True:
+						self.scanAborted()
+						return
+			self.rowDone()
+			self.cells = self.new_cells
+			self.size = self.half
+
+	def moveToPoint(self,i,j,x_step,y_step):
+		#y only moves at the start of a row
+		if j != self.current_row:
+			self.mover.moveToXY(x_step,y_step)
+			self.current_row = j
+		else:
+			self.mover.moveTo('x',x_step)
+
+	def readPosition(self):
+		#copied, as the next move may already be under way when it is used
+		return dict(self.mover.getPos())
+
+	def runPipelinedClosedLoopMap(self):
+		#mover and measurer each get an I/O worker, so the position readout,
+		#the readings' transfer (for drivers that say when their gate
+		#closes) and data handling for one point overlap the move to the
+		#next; the detector only ever reads while the stage is still
+		#(the workers are set up by runScan)
+		self.points = [point for point in self.scanOrder() if point[:2] not in self.done]
+		if self.points == []:
+			return
+		self.current_row = None
+		self.move = self.move_worker.submit(self.moveToPoint,*self.points[0])
+		for k, (i, j, x_step, y_step) in enumerate(self.points):
+			self.move.result()
+			self.setMoveTime(self.move.finished_at)
+			self.move_time = self.move.finished_at-self.move.started_at
+			self.position = self.move_worker.submit(self.readPosition)
+			self.gates = [pipeline.Signal() for measurer in self.measurers]
+			self.readings = [worker.submit(self.gatedReading,measurer,gate)
+							 for worker, measurer, gate in zip(self.read_workers,self.measurers,self.gates)]
+			#the next move goes as soon as every detector's gate has closed,
+			#so it overlaps the readings' transfer as well as the bookkeeping
+			for gate in self.gates:
+				gate.wait()
+			if k+1 < len(self.points) and self.abort == False:
+				self.move = self.move_worker.submit(self.moveToPoint,*self.points[k+1])
+			self.values = [reading.result() for reading in self.readings]
+			self.meas = self.values[0]
+			self.pos = self.position.result()
+			self.addLatency('move',self.move_time+(self.position.finished_at-self.position.started_at))
+			self.addLatency('readout',max(reading.finished_at for reading in self.readings)-
+									  min(reading.started_at for reading in self.readings)-self.readTime())
+			self.point = [self.pos['x'],self.pos['y'],i,j]+self.values
+			self.storePoint(self.point)
+			if k+1 == len(self.points) or self.points[k+1][1] != j:
+				self.rowDone()
+			if self.abort == True:
+				self.scanAborted()
+				return
+
+	def runOpenLoopMap(self):
+		self.step = {'x':0,'y':0}
+		while True:
+			while True:
+				self.pos = self.mover.getPos()
+				if (self.x_steps == float('inf') and self.xgoesup and self.pos['x'] > self.meas_par['xt']) or (
+				   self.x_steps == float('inf') and not self.xgoesup and self.pos['x'] < self.meas_par['xt']):
+					self.x_steps = self.step['x']
+					self.foundXSteps(int(self.x_steps)+1)
+				self.values = self.readMeasurers()
+				self.point = [self.pos['x'],self.pos['y'],self.step['x'],self.step['y']]+self.values
+				self.dataset.append(self.point,dwell=self.pointDwell())
+				if self.step['x'] >= self.x_steps:
+					break
+				self.step['x'] += 1
+				if self.xgoesup: #if xto > xfrom:
+					self.mover.moveUp('x')
+				else:
+					self.mover.moveDown('x')
+				self.setMoveTime(time.time())
+				if self.abort == True:
+					self.scanAborted()
+					return
+
+			self.rowDone()
+			self.step['x']=0
+			if (self.y_steps == float('inf') and self.ygoesup and self.pos['y'] > self.meas_par['yt']) or (
+			   self.y_steps == float('inf') and not self.ygoesup and self.pos['y'] < self.meas_par['yt']):
+				self.y_steps = self.step['y']
+				self.foundYSteps(int(self.y_steps))
+				break
+
+			self.mover.moveTo('x',self.meas_par['xf'])
+			self.step['y']+=1
+			if self.ygoesup: #if xto > xfrom:
+				self.mover.moveUp('y')
+			else:
+				self.mover.moveDown('y')
+			self.setMoveTime(time.time())
+
+			if self.abort == True:
+				self.scanAborted()
+				return
+
+
+	def init(self):
+		#instantiate instrumentation (that has now passed the tests);
+		#instances passed in are already open and used as they are
+		self.owned = []
+		try:
+			self.meas_par['mover'] = self.openDevice(self.meas_par['mover'])
+			self.meas_par['measurers'] = [self.openDevice(device) for device in self.meas_par.get('measurers',[self.meas_par['measurer']])]
+			self.meas_par['measurer'] = self.meas_par['measurers'][0]
+		except:
+			print 'Problem instantiating mover/measurer!'
+			self.scanFinished()
+		self.mover = self.meas_par['mover']
+		self.measurer = self.meas_par['measurer']
+		self.measurers = self.meas_par['measurers']
+		self.channels = channelsOf(self.meas_par)
+
+		#perform setup of devices
+		if 'm' in self.meas_par['mtype']:
+			self.mover.setDefaults( self.meas_par['v'],
+									self.meas_par['f'],
+									self.meas_par['c'],
+									self.meas_par['vr'])
+			self.x_steps = float('inf')
+			self.y_steps = float('inf')
+		elif 'M' in self.meas_par['mtype']:
+			self.mover.setClosedCircuitDefaults(1000,self.meas_par['vr'])
+			self.x_steps = self.meas_par['n']+1
+			self.y_steps = self.meas_par['n']+1
+			self.foundXSteps(int(self.x_steps))
+			self.foundYSteps(int(self.y_steps))
+			self.x_steplist = np.linspace(self.meas_par['xf'],self.meas_par['xt'],self.x_steps)
+			self.y_steplist = np.linspace(self.meas_par['yf'],self.meas_par['yt'],self.y_steps)
+		elif 's' in self.meas_par['mtype']:
+			self.mover.setDefaults(	self.meas_par['xv'],
+									self.meas_par['yv'])
+			self.x_steps = (abs(self.meas_par['xt']-self.meas_par['xf'])/self.meas_par['xv'])+1
+			self.y_steps = (abs(self.meas_par['yt']-self.meas_par['yf'])/self.meas_par['yv'])+1
+			self.x_steplist = np.linspace(self.meas_par['xf'],self.meas_par['xt'],self.x_steps)
+			self.y_steplist = np.linspace(self.meas_par['yf'],self.meas_par['yt'],self.y_steps)
+			self.foundXSteps(int(self.x_steps))
+			self.foundYSteps(int(self.y_steps))
+		if self.meas_par['adaptive']:
+			#adaptive maps work on a lattice 2**levels finer than the coarse grid
+			self.x_steps = int(round(self.x_steps-1))*2**self.meas_par['levels']+1
+			self.y_steps = int(round(self.y_steps-1))*2**self.meas_par['levels']+1
+			self.x_steplist = np.linspace(self.meas_par['xf'],self.meas_par['xt'],self.x_steps)
+			self.y_steplist = np.linspace(self.meas_par['yf'],self.meas_par['yt'],self.y_steps)
+			self.foundXSteps(int(self.x_steps))
+			self.foundYSteps(int(self.y_steps))
+		#values of the points already measured, when resuming
+		self.done = {}
+		if self.meas_par.get('resume'):
+			for i, j, value in zip(self.dataset.column('i'),self.dataset.column('j'),self.dataset.column('value')):
+				self.done[(int(i),int(j))] = value
+		for channel, measurer in zip(self.channels,self.measurers):
+			tm, tp = channelTimes(self.meas_par,channel)
+			measurer.setDefaults(tm,tp)
+			if channel == 'c' and self.meas_par.get('precision'):
+				measurer.setPrecision(self.meas_par['precision'])
+			elif channel == 'c' and self.meas_par.get('gates',1) > 1:
+				measurer.setAveraging(self.meas_par['gates'])
+			elif channel == 'r' and self.meas_par.get('samples',1) > 1:
+				measurer.setAveraging(self.meas_par['samples'])
+
+	def openDevice(self,device):
+		#classes are opened and closed again after the scan
+		if inspect.isclass(device):
+			device = device()
+			self.owned.append(device)
+		return device
+
+	def foundXSteps(self,x_steps):
+		pass
+
+	def planeStarted(self,plane,z):
+		pass
+
+	def foundYSteps(self,y_steps):
+		pass
+
+	def rowDone(self):
+		pass
+
+	def scanAborted(self):
+		pass
+
+	def scanFinished(self):
+		pass
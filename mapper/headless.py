@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+runs a map without the GUI:
+
+	python headless.py scan.json output
+
+scan.json holds the meas_par keys MapperProg builds (mtype, xf, xt, yf,
+yt, vr, tm, tp, plus n for closed-loop motor maps, xv/yv for scanner
+maps or v/f/c for open-loop ones, and optionally serpentine, adaptive,
+levels, threshold, maxpoints, precision or gates (gates averaged per
+point, taken by the counter on one trigger and read together) for counter maps,
+samples (the same from the lock-in's curve buffer) and channels, eg
+["r", "c"], to read several detectors in the same pass, with
+tm_<channel>/tp_<channel> for those after the first, and zstack with
+zf, zt and zn to repeat the map over zn planes from zf to zt), a DEVICES
+block as in settings.json (settings.json's own is used if it is left out)
+and optionally a metadata block of MapperProg fields (username,
+deviceId, comment, ...)
+
+with "virtualclock": true in DEVICES the fake instruments run on a
+virtual clock, so the scan takes only as long as the Python around them;
+how long the instruments would have taken is printed at the end
+
+the duration estimate uses the latencies settings.json's LATENCY block
+has for the devices, and the ones this run saw are added to it, as
+MapperProg does
+
+points are journalled to output.jsonl as they are measured, and
+output.json is written at the end in the format MapperProg saves (with
+the planes of a z-stack in output.npy, filled in as they are measured);
+Ctrl-C stops the scan after the current point
+'''
+
+import os
+import sys
+import json
+import time
+import threading
+
+from engine import ScanEngine, deviceName, findDevices, checkLimits, channelsOf
+from dataset import MapperDataset
+from journal import Journal
+from volume import Volume
+import planner
+import simclock
+
+settings_file = 'settings.json'
+scan_defaults = {'serpentine':False,'adaptive':False,'zstack':False}
+
+class HeadlessScan(ScanEngine):
+	'''
+	ScanEngine reporting to the console and the journal
+	'''
+	def __init__(self,meas_par,dataset,journal,volume=None):
+		ScanEngine.__init__(self,meas_par,dataset,volume)
+		self.journal = journal
+		self.found = {}
+		self.planned_points = planner.plannedPoints(meas_par)
+
+	def foundXSteps(self,x_steps):
+		self.found['x_steps'] = x_steps
+		self.journal.note('x_steps',x_steps)
+
+	def foundYSteps(self,y_steps):
+		self.found['y_steps'] = y_steps
+		self.journal.note('y_steps',y_steps)
+
+	def planeStarted(self,plane,z):
+		print 'Plane '+str(plane+1)+'/'+str(int(self.meas_par['zn']))+' at z = '+str(z)
+
+	def rowDone(self):
+		self.journal.sync()
+		if self.planned_points == None:
+			print str(len(self.dataset))+' points'
+			return
+		self.eta = planner.remainingTime(self.dataset.column('timestamp'),self.planned_points-len(self.dataset))
+		if self.eta == None:
+			print str(len(self.dataset))+'/'+str(self.planned_points)+' points'
+		else:
+			print str(len(self.dataset))+'/'+str(self.planned_points)+' points, about '+planner.formatDuration(self.eta)+' left'
+
+	def scanAborted(self):
+		print 'Scan stopped'
+
+def loadSettings():
+	'''
+	settings.json as MapperProg keeps it, or None if there is none
+	'''
+	try:
+		with open(settings_file,'r') as f:
+			return json.loads(f.read())
+	except IOError:
+		return None
+
+def saveLatencies(scan):
+	'''
+	folds the latencies seen in this run into settings.json's LATENCY
+	block, as MapperProg does after a map, for later estimates
+	'''
+	settings = loadSettings()
+	if settings == None:
+		return
+	settings.setdefault('LATENCY',{})
+	names = {'move':deviceName(scan.meas_par['mover']),'readout':deviceName(scan.meas_par['measurer'])}
+	for phase in ['move','readout']:
+		total, count = scan.latency[phase]
+		if count > 0:
+			planner.updateHistory(settings['LATENCY'],names[phase],phase,max(0.0,total/count))
+	with open(settings_file,'w') as f:
+		f.write(json.dumps(settings))
+
+def loadScan(path):
+	'''
+	(meas_par, DEVICES block, metadata) from a scan description file
+	'''
+	with open(path,'r') as f:
+		scan = json.loads(f.read())
+	devices = scan.pop('DEVICES',None)
+	if devices == None:
+		devices = loadSettings()['DEVICES']
+	metadata = scan.pop('metadata',{})
+	meas_par = dict(scan_defaults)
+	meas_par['pipelined'] = devices.get('pipelined',False)
+	meas_par.update(scan)
+	return meas_par, devices, metadata
+
+def main(argv):
+	if len(argv) != 3:
+		print __doc__
+		return 1
+	meas_par, devices, metadata = loadScan(argv[1])
+	simclock.clock.setVirtual(devices.get('virtualclock',False))
+	error = findDevices(meas_par,devices)
+	if error == None:
+		error = checkLimits(meas_par)
+	if error != None:
+		print error
+		return 1
+
+	metadata['dateandtime'] = time.asctime()
+	metadata['meas_par'] = meas_par
+	metadata['x_forward'] = meas_par['xf'] <= meas_par['xt']
+	metadata['y_forward'] = meas_par['yf'] <= meas_par['yt']
+	metadata['x_steps'] = None
+	metadata['y_steps'] = None
+	describe = lambda obj: {'__class__':deviceName(obj)}
+
+	volume = None
+	if meas_par['zstack']:
+		x_steps, y_steps = planner.gridSize(meas_par)
+		volume = Volume(argv[2]+'.npy',(len(channelsOf(meas_par)),meas_par['zn'],y_steps,x_steps))
+	dataset = MapperDataset(channels=len(channelsOf(meas_par)))
+	journal = Journal(argv[2]+'.jsonl',metadata,devices.get('journalsync',10),describe)
+	dataset.setJournal(journal)
+	scan = HeadlessScan(meas_par,dataset,journal,volume)
+	if scan.planned_points != None:
+		settings = loadSettings()
+		history = {} if settings == None else settings.get('LATENCY',{})
+		print str(scan.planned_points)+' points, estimated '+planner.formatDuration(planner.estimateDuration(
+			meas_par,history,deviceName(meas_par['mover']),deviceName(meas_par['measurer']),scan.planned_points))
+
+	#the scan runs on its own thread so Ctrl-C can be caught here
+	simclock.clock.reset()
+	worker = threading.Thread(target=scan.runScan)
+	worker.daemon = True
+	worker.start()
+	try:
+		while worker.is_alive():
+			worker.join(0.5)
+	except KeyboardInterrupt:
+		print 'Stopping after the current point...'
+		scan.abort = True
+		worker.join()
+	simclock.clock.catchUp(simclock.clock.stamp(worker))
+	dataset.setJournal(None)
+	journal.close()
+	saveLatencies(scan)
+	if volume != None:
+		volume.close()
+
+	metadata.update(scan.found)
+	contents = {'metadata':metadata,
+				'data':dataset.tolist(),
+				'timestamps':dataset.column('timestamp').tolist()}
+	if dataset.dwells() != None:
+		contents['dwell'] = dataset.dwells()
+	if volume != None:
+		contents['volume'] = os.path.basename(argv[2])+'.npy'
+	with open(argv[2]+'.json','w') as f:
+		f.write(json.dumps(contents,default=describe))
+	print 'Saved '+str(len(dataset))+' points to '+argv[2]+'.json'
+	if simclock.clock.virtual:
+		print 'The fake instruments would have taken '+planner.formatDuration(simclock.clock.elapsed())
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main(sys.argv))
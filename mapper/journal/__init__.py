@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import threading
+
+class Journal:
+	'''
+	append-only crash journal: one JSON line of metadata, then one short
+	line per point ([x, y, i, j, value, timestamp], plus the dwell for
+	measurers that choose their own; value is a list of one per channel
+	for maps read with several detectors) and the odd
+	{"key": value} line for metadata learned during the scan (eg x_steps
+	of an open-loop map); each point costs one write, and the file is
+	fsync'd every sync_every points (every point if None) or on sync()
+	'''
+	def __init__(self,path,metadata,sync_every=10,default=None):
+		self.lock = threading.Lock()
+		self.sync_every = sync_every
+		self.default = default
+		self.unsynced = 0
+		self.f = open(path,'w')
+		self.write({'metadata':metadata})
+		self.sync()
+
+	def write(self,record):
+		self.f.write(json.dumps(record,separators=(',',':'),default=self.default)+'\n')
+
+	def record(self,row,timestamp,dwell=None):
+		'''
+		adds one point; called from the acquisition thread
+		'''
+		value = row[4] if len(row) == 5 else list(row[4:])
+		with self.lock:
+			if dwell == None:
+				self.write([row[0],row[1],int(row[2]),int(row[3]),value,timestamp])
+			else:
+				self.write([row[0],row[1],int(row[2]),int(row[3]),value,timestamp,dwell])
+			self.unsynced += 1
+			if self.sync_every == None or self.unsynced >= self.sync_every:
+				self.flush()
+
+	def note(self,key,value):
+		'''
+		adds/overrides one metadata entry
+		'''
+		with self.lock:
+			self.write({key:value})
+			self.flush()
+
+	def sync(self):
+		with self.lock:
+			self.flush()
+
+	def flush(self):
+		self.f.flush()
+		os.fsync(self.f.fileno())
+		self.unsynced = 0
+
+	def close(self):
+		with self.lock:
+			if not self.f.closed:
+				self.flush()
+				self.f.close()
+
+def readJournal(path):
+	'''
+	rebuilds {'metadata', 'data', 'timestamps', 'dwell'} (as in a saved
+	file) from a journal, stopping at the first incomplete line of one cut
+	short
+	'''
+	metadata = {}
+	rows = []
+	timestamps = []
+	dwells = []
+	with open(path,'r') as f:
+		for line in f:
+			if not line.endswith('\n'):
+				break
+			try:
+				record = json.loads(line)
+			except ValueError:
+				break
+			if isinstance(record,list):
+				if isinstance(record[4],list):
+					rows.append(record[:4]+record[4])
+				else:
+					rows.append(record[:5])
+				timestamps.append(record[5])
+				dwells.append(record[6] if len(record) > 6 else None)
+			elif 'metadata' in record:
+				metadata = record['metadata']
+			else:
+				metadata.update(record)
+	contents = {'metadata':metadata,'data':rows,'timestamps':timestamps}
+	if any(dwell != None for dwell in dwells):
+		contents['dwell'] = dwells
+	return contents
@@ -15,12 +15,20 @@ import json
 import time
 import csv
 import os
+import shutil
+import collections
 
 from pyvisa.errors import InvalidSession
 
 import colormaps
 import movement
 import measurement
+import simclock
+from engine import ScanEngine, deviceName, findDevices, checkLimits, channelsOf, zPositions
+from dataset import MapperDataset
+from journal import Journal, readJournal
+from volume import Volume, bestFocus, sharpestPlane
+import planner
 
 from sim900 import Sim900
 from attenuator import Attenuator
@@ -30,6 +38,12 @@ from matplotlib.backends.backend_qt4agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
 
 settings_file = 'settings.json'
+rescue_file = 'rescued.jsonl'
+volume_file = 'volume.npy' #z-stack being measured; copied next to the data file on saving
+refresh_interval = 50 #ms between preview redraws while acquiring (20 Hz)
+clim_headroom = 0.1 #fraction of the span the preview's colour limits widen past a new extreme
+clim_redraw_interval = 1.0 #s between full preview redraws (colorbar) while the limits change
+channel_names = {'r':'Reflection','c':'Counts'}
 
 def getSettings():
 	try:
@@ -37,6 +51,15 @@ def getSettings():
 			settings = json.loads(f.read())
 	except IOError:
 		settings = defaultSettings()
+	#fill in any keys added since the settings file was written
+	defaults = defaultSettings()
+	for key in defaults.keys():
+		if key not in settings:
+			settings[key] = defaults[key]
+		elif type(defaults[key]) == dict:
+			for subkey in defaults[key].keys():
+				if subkey not in settings[key]:
+					settings[key][subkey] = defaults[key][subkey]
 	return settings
 
 def defaultSettings():
@@ -50,7 +73,10 @@ def defaultSettings():
 				'tsourcemod':1,
 				'tinput':3,
 				'att1addr':'GPIB::10',
-				'att2addr':'GPIB::15'},
+				'att2addr':'GPIB::15',
+				'pipelined':False,
+				'journalsync':10,
+				'virtualclock':False},
 			'EXPORT':{
 					'title':True,
 					'convert_to_sde':True,
@@ -78,16 +104,31 @@ def defaultSettings():
 					'clicks_m': 10,
 					'closedloop_m': False,
 					'numpoints_m': 20,
+					'serpentine_m': False,
 					'xfrom_s': 0,
 					'xto_s': 10,
 					'yfrom_s': 0,
 					'yto_s': 10,
 					'xvoltstep_s': 1,
 					'yvoltstep_s': 1,
+					'serpentine_s': False,
+					'fly_s': False,
+					'adaptive_a': False,
+					'levels_a': 2,
+					'threshold_a': 0.1,
+					'maxpoints_a': 1000,
+					'zstack_z': False,
+					'zfrom_z': 2,
+					'zto_z': 3,
+					'zplanes_z': 5,
 					'meastime_c': 0.7,
 					'pausetime_c': 0.2,
+					'precision_c': 0,
+					'gates_c': 1,
 					'meastime_r': 0.05,
 					'pausetime_r': 0.05,
+					'samples_r': 1,
+					'bothdetectors': False,
 					'username':'',
 					'dateandtime':'',
 					'batchName':'',
@@ -103,7 +144,8 @@ def defaultSettings():
 					'atten':'',
 					'wavelength':'',
 					'dcr':''},
-			'targetfolder':''
+			'targetfolder':'',
+			'LATENCY':{}
 			}
 
 def setSettings(settings):
@@ -114,6 +156,48 @@ def setSettings(settings):
 	except IOError:
 		return False
 
+def gridFromData(dataset,x_steps=None,y_steps=None,levels=0,values=None):
+	'''
+	places each point of a MapperDataset at its (i, j) index,
+	so rows scanned in either direction land in the right place;
+	cells not yet measured are NaN
+
+	adaptive maps (levels > 0) sit on a lattice 2**levels finer than the
+	coarse grid, so each point is painted over the block it stands for,
+	largest blocks first so refined points show through
+
+	values, if given, are used in place of the dataset's own
+	'''
+	i_index = dataset.column('i')
+	j_index = dataset.column('j')
+	if values is None:
+		values = dataset.column('value')
+	nx = int(i_index.max())+1
+	ny = int(j_index.max())+1
+	if x_steps != None:
+		nx = max(nx,int(x_steps))
+	if y_steps != None:
+		ny = max(ny,int(y_steps))
+	z_data = np.empty((ny,nx))
+	z_data.fill(np.nan)
+	if levels == 0:
+		z_data[j_index,i_index] = values
+	else:
+		coarse = 2**levels
+		#a point's block is the largest power of two dividing both indices
+		blocks = [min(i & -i or coarse, j & -j or coarse, coarse) for i, j in zip(i_index,j_index)]
+		for n in sorted(range(len(blocks)),key=lambda n: -blocks[n]):
+			lo_i = max(i_index[n]-blocks[n]//2,0)
+			lo_j = max(j_index[n]-blocks[n]//2,0)
+			z_data[lo_j:lo_j+blocks[n],lo_i:lo_i+blocks[n]] = values[n]
+	return z_data
+
+def adaptiveLevels(meas_par):
+	#refinement levels of an adaptive map, or 0 for a regular one
+	if meas_par != None and meas_par.get('adaptive',False):
+		return int(meas_par['levels'])
+	return 0
+
 def convert_to_builtin_type(obj):
 	#from https://pymotw.com/2/json/
 	#print 'default(', repr(obj), ')'
@@ -145,9 +229,19 @@ class MapperProg(QtGui.QMainWindow):
 
 		#finalize things
 		self.filename = ''
-		self.data = []
+		self.data = MapperDataset()
+		self.volume = None
+		self.preview = None
+		self.shown = 0
+		self.jobs = []
+		self.session = {}
+		self.queue_running = False
+		self.drain_timer = QtCore.QTimer(self)
+		self.drain_timer.setInterval(refresh_interval)
+		self.drain_timer.timeout.connect(self.drainData)
 		self.mapper_tool_running = False
 		self.settings = getSettings()
+		simclock.clock.setVirtual(self.settings['DEVICES']['virtualclock'])
 		self.setDefaults()
 		self.name_of_application = 'Mapper'
 		#self.resize(800,500)
@@ -199,6 +293,30 @@ class MapperProg(QtGui.QMainWindow):
 		self.haltAction.triggered.connect(self.halt)
 		self.haltAction.setEnabled(False)
 
+		self.resumeAction = QtGui.QAction(QtGui.QIcon(r'icons\acquire.png'),'Res&ume',self)
+		self.resumeAction.setShortcut('Ctrl+U')
+		self.resumeAction.setStatusTip('Carry on an interrupted scan from its first unmeasured point (Ctrl-U)')
+		self.resumeAction.triggered.connect(self.resume)
+
+		queueAction = QtGui.QAction('Add scan to &queue',self)
+		queueAction.setShortcut('Ctrl+E')
+		queueAction.setStatusTip('Queue the scan set up now, to run later with Run queue (Ctrl-E)')
+		queueAction.triggered.connect(self.queueScan)
+
+		self.runQueueAction = QtGui.QAction('Run queue',self)
+		self.runQueueAction.setStatusTip('Run the queued scans one after another, saving each')
+		self.runQueueAction.triggered.connect(self.runQueue)
+		self.runQueueAction.setEnabled(False)
+
+		clearQueueAction = QtGui.QAction('Clear queue',self)
+		clearQueueAction.setStatusTip('Remove all queued scans')
+		clearQueueAction.triggered.connect(self.clearQueue)
+
+		estimateAction = QtGui.QAction('Estimate &duration',self)
+		estimateAction.setShortcut('Ctrl+D')
+		estimateAction.setStatusTip('Estimate how long the scan set up would take (Ctrl-D)')
+		estimateAction.triggered.connect(self.estimate)
+
 		plotAction = QtGui.QAction(QtGui.QIcon(r'icons\plot.png'),'&Plot',self)
 		plotAction.setShortcut('Ctrl+P')
 		plotAction.setStatusTip('Plot data graphically (Ctrl-P)')
@@ -244,7 +362,13 @@ class MapperProg(QtGui.QMainWindow):
 		fileMenu.addAction(exitAction)
 		toolMenu=menubar.addMenu('&Tools')
 		toolMenu.addAction(self.acquireAction)
+		toolMenu.addAction(self.resumeAction)
 		toolMenu.addAction(self.haltAction)
+		toolMenu.addAction(estimateAction)
+		toolMenu.addSeparator()
+		toolMenu.addAction(queueAction)
+		toolMenu.addAction(self.runQueueAction)
+		toolMenu.addAction(clearQueueAction)
 		toolMenu.addSeparator()
 		toolMenu.addAction(plotAction)
 		toolMenu.addAction(exportAction)
@@ -264,6 +388,7 @@ class MapperProg(QtGui.QMainWindow):
 		self.toolbar.addAction(newSequentialAction)
 		self.toolbar.addSeparator()
 		self.toolbar.addAction(self.acquireAction)
+		self.toolbar.addAction(self.resumeAction)
 		self.toolbar.addAction(self.haltAction)
 		self.toolbar.addSeparator()
 		self.toolbar.addAction(plotAction)
@@ -271,6 +396,13 @@ class MapperProg(QtGui.QMainWindow):
 		self.toolbar.addSeparator()
 		self.toolbar.addAction(toolAction)
 		self.toolbar.addAction(flipAction)
+		self.toolbar.addSeparator()
+		self.channel_select = QtGui.QComboBox()
+		self.channel_select.setEnabled(False)
+		self.channel_select.setStatusTip('Detector channel shown in the preview')
+		self.channel_select.currentIndexChanged.connect(self.showChannel)
+		self.toolbar.addWidget(QtGui.QLabel(' Channel: '))
+		self.toolbar.addWidget(self.channel_select)
 
 	def createLayoutsAndWidgets(self):
 		self.metadata_grid = QtGui.QGridLayout()
@@ -278,18 +410,24 @@ class MapperProg(QtGui.QMainWindow):
 		self.scanner_grid = QtGui.QGridLayout()
 		self.count_grid = QtGui.QGridLayout()
 		self.reflec_grid = QtGui.QGridLayout()
+		self.adaptive_grid = QtGui.QGridLayout()
+		self.zstack_grid = QtGui.QGridLayout()
 
 		self.metadata_widget = QtGui.QGroupBox('Metadata')
 		self.motor_widget = QtGui.QWidget()
 		self.scanner_widget = QtGui.QWidget()
 		self.count_widget = QtGui.QWidget()
 		self.reflec_widget = QtGui.QWidget()
+		self.adaptive_widget = QtGui.QGroupBox('Adaptive refinement')
+		self.zstack_widget = QtGui.QGroupBox('Z stack')
 
 		for grid, widget in [[self.metadata_grid, self.metadata_widget],
 							 [self.motor_grid, self.motor_widget],
 							 [self.scanner_grid, self.scanner_widget],
 							 [self.count_grid, self.count_widget],
-							 [self.reflec_grid, self.reflec_widget]]:
+							 [self.reflec_grid, self.reflec_widget],
+							 [self.adaptive_grid, self.adaptive_widget],
+							 [self.zstack_grid, self.zstack_widget]]:
 			layout = QtGui.QVBoxLayout()
 			layout.addLayout(grid)
 			widget.setLayout(layout)
@@ -300,12 +438,15 @@ class MapperProg(QtGui.QMainWindow):
 		self.movement_tab.setFixedWidth(250)
 		self.measurement_tab.setFixedWidth(250)
 		self.metadata_widget.setFixedWidth(500)
+		self.adaptive_widget.setFixedWidth(500)
+		self.zstack_widget.setFixedWidth(500)
 
 		self.movement_tab.addTab(self.motor_widget,'Motor')
 		self.movement_tab.addTab(self.scanner_widget,'Scanner')
 
 		self.measurement_tab.addTab(self.reflec_widget,'Reflection')
 		self.measurement_tab.addTab(self.count_widget,'Counts')
+		self.bothdetectors = QtGui.QCheckBox('Read reflection and counts in the same pass (selected tab is the main channel)')
 
 		self.checkForGraph() #does the graph
 
@@ -314,6 +455,9 @@ class MapperProg(QtGui.QMainWindow):
 		self.vbox = QtGui.QVBoxLayout()
 		self.vbox.addWidget(self.metadata_widget)
 		self.vbox.addLayout(self.tabhbox)
+		self.vbox.addWidget(self.bothdetectors)
+		self.vbox.addWidget(self.adaptive_widget)
+		self.vbox.addWidget(self.zstack_widget)
 		self.vbox.addStretch(1)
 		self.hbox.addLayout(self.vbox)
 		self.hbox.addWidget(self.canvas)
@@ -409,7 +553,9 @@ class MapperProg(QtGui.QMainWindow):
 		self.clicks_m = QtGui.QLineEdit('')
 		self.numpoints_m = QtGui.QLineEdit('')
 		self.closedloop_m = QtGui.QCheckBox('Closed-loop')
+		self.serpentine_m = QtGui.QCheckBox('Serpentine')
 		self.numpoints_m.setEnabled(False)
+		self.serpentine_m.setEnabled(False)
 
 		self.motor_grid.addWidget(QtGui.QLabel('X range:'),0,0)
 		self.motor_grid.addWidget(self.xfrom_m,0,1)
@@ -432,8 +578,10 @@ class MapperProg(QtGui.QMainWindow):
 		self.motor_grid.addWidget(self.closedloop_m,4,0,1,2)
 		self.motor_grid.addWidget(QtGui.QLabel('Points:'),4,2)
 		self.motor_grid.addWidget(self.numpoints_m,4,3)
+		self.motor_grid.addWidget(self.serpentine_m,5,0,1,2)
 
 		self.closedloop_m.stateChanged.connect(self.numpoints_m.setEnabled)
+		self.closedloop_m.stateChanged.connect(self.serpentine_m.setEnabled)
 		self.closedloop_m.stateChanged.connect(self.clicks_m.setDisabled)
 		self.closedloop_m.stateChanged.connect(self.volt_m.setDisabled)
 		self.closedloop_m.stateChanged.connect(self.freq_m.setDisabled)
@@ -445,6 +593,8 @@ class MapperProg(QtGui.QMainWindow):
 		self.yto_s = QtGui.QLineEdit('')
 		self.xvoltstep_s = QtGui.QLineEdit('')
 		self.yvoltstep_s = QtGui.QLineEdit('')
+		self.serpentine_s = QtGui.QCheckBox('Serpentine')
+		self.fly_s = QtGui.QCheckBox('Fly scan')
 
 		self.scanner_grid.addWidget(QtGui.QLabel('X range:'),0,0)
 		self.scanner_grid.addWidget(self.xfrom_s,0,1)
@@ -459,25 +609,68 @@ class MapperProg(QtGui.QMainWindow):
 		self.scanner_grid.addWidget(self.xvoltstep_s,2,1)
 		self.scanner_grid.addWidget(QtGui.QLabel('Y step:'),2,2)
 		self.scanner_grid.addWidget(self.yvoltstep_s,2,3)
+		self.scanner_grid.addWidget(self.serpentine_s,3,0,1,2)
+		self.scanner_grid.addWidget(self.fly_s,3,2,1,2)
 
 
 		#populate counts grid
 		self.meastime_c = QtGui.QLineEdit('')
 		self.pausetime_c = QtGui.QLineEdit('')
+		self.precision_c = QtGui.QLineEdit('')
+		self.precision_c.setToolTip('Stop counting once the rate is known to this relative precision (eg 0.01); the measurement time is then the longest dwell. 0 counts for the full measurement time at every point')
+		self.gates_c = QtGui.QLineEdit('')
+		self.gates_c.setToolTip('Split the measurement time into this many gates, taken by the counter on one trigger and read back together; the point is their mean rate. 1 takes a single gate')
 
 		self.count_grid.addWidget(QtGui.QLabel('T<sub>meas</sub>:'),0,0)
 		self.count_grid.addWidget(self.meastime_c,0,1)
 		self.count_grid.addWidget(QtGui.QLabel('T<sub>pause</sub>:'),1,0)
 		self.count_grid.addWidget(self.pausetime_c,1,1)
+		self.count_grid.addWidget(QtGui.QLabel('Precision:'),2,0)
+		self.count_grid.addWidget(self.precision_c,2,1)
+		self.count_grid.addWidget(QtGui.QLabel('Gates:'),3,0)
+		self.count_grid.addWidget(self.gates_c,3,1)
 
 		#populate reflectance grid
 		self.meastime_r = QtGui.QLineEdit('')
 		self.pausetime_r = QtGui.QLineEdit('')
+		self.samples_r = QtGui.QLineEdit('')
+		self.samples_r.setToolTip('Average this many readings spread over the measurement time, stored in the lock-in\'s curve buffer and read back together. 1 takes a single reading')
 
 		self.reflec_grid.addWidget(QtGui.QLabel('T<sub>meas</sub>:'),0,0)
 		self.reflec_grid.addWidget(self.meastime_r,0,1)
 		self.reflec_grid.addWidget(QtGui.QLabel('T<sub>pause</sub>:'),1,0)
 		self.reflec_grid.addWidget(self.pausetime_r,1,1)
+		self.reflec_grid.addWidget(QtGui.QLabel('Samples:'),2,0)
+		self.reflec_grid.addWidget(self.samples_r,2,1)
+
+		#populate adaptive refinement grid
+		self.adaptive_a = QtGui.QCheckBox('Adaptive')
+		self.levels_a = QtGui.QLineEdit('')
+		self.threshold_a = QtGui.QLineEdit('')
+		self.maxpoints_a = QtGui.QLineEdit('')
+
+		self.adaptive_grid.addWidget(self.adaptive_a,0,0)
+		self.adaptive_grid.addWidget(QtGui.QLabel('Levels:'),0,1)
+		self.adaptive_grid.addWidget(self.levels_a,0,2)
+		self.adaptive_grid.addWidget(QtGui.QLabel('Threshold:'),0,3)
+		self.adaptive_grid.addWidget(self.threshold_a,0,4)
+		self.adaptive_grid.addWidget(QtGui.QLabel('Max points:'),0,5)
+		self.adaptive_grid.addWidget(self.maxpoints_a,0,6)
+
+		#populate z-stack grid
+		self.zstack_z = QtGui.QCheckBox('Z stack')
+		self.zfrom_z = QtGui.QLineEdit('')
+		self.zto_z = QtGui.QLineEdit('')
+		self.zplanes_z = QtGui.QLineEdit('')
+		self.zstack_z.setToolTip('Repeat a closed-loop or scanner map at each of a number of z positions, from the first to the last')
+
+		self.zstack_grid.addWidget(self.zstack_z,0,0)
+		self.zstack_grid.addWidget(QtGui.QLabel('Z range:'),0,1)
+		self.zstack_grid.addWidget(self.zfrom_z,0,2)
+		self.zstack_grid.addWidget(QtGui.QLabel('->'),0,3)
+		self.zstack_grid.addWidget(self.zto_z,0,4)
+		self.zstack_grid.addWidget(QtGui.QLabel('Planes:'),0,5)
+		self.zstack_grid.addWidget(self.zplanes_z,0,6)
 
 		self.key_object_map = {
 								'username': self.username,
@@ -505,16 +698,31 @@ class MapperProg(QtGui.QMainWindow):
 								'readv_m':self.readv_m,
 								'closedloop_m':self.closedloop_m,
 								'numpoints_m':self.numpoints_m,
+								'serpentine_m':self.serpentine_m,
 								'xfrom_s':self.xfrom_s,
 								'xto_s':self.xto_s,
 								'yfrom_s':self.yfrom_s,
 								'yto_s':self.yto_s,
 								'xvoltstep_s':self.xvoltstep_s,
 								'yvoltstep_s':self.yvoltstep_s,
+								'serpentine_s':self.serpentine_s,
+								'fly_s':self.fly_s,
+								'adaptive_a':self.adaptive_a,
+								'levels_a':self.levels_a,
+								'threshold_a':self.threshold_a,
+								'maxpoints_a':self.maxpoints_a,
+								'zstack_z':self.zstack_z,
+								'zfrom_z':self.zfrom_z,
+								'zto_z':self.zto_z,
+								'zplanes_z':self.zplanes_z,
 								'meastime_c':self.meastime_c,
 								'pausetime_c':self.pausetime_c,
+								'precision_c':self.precision_c,
+								'gates_c':self.gates_c,
+								'bothdetectors':self.bothdetectors,
 								'meastime_r':self.meastime_r,
-								'pausetime_r':self.pausetime_r}
+								'pausetime_r':self.pausetime_r,
+								'samples_r':self.samples_r}
 
 	def setDefaults(self):
 		for key in self.key_object_map.keys():
@@ -560,96 +768,117 @@ class MapperProg(QtGui.QMainWindow):
 				event.accept()
 			return False
 
-	def acquire(self):
+	def scanParameters(self):
 		#first: work out what measurement we're trying to run
-		#by finding which tabs are selected
-		if self.data != []:
-			reply = QtGui.QMessageBox.question(self,'Mapper',
-				'Overwrite existing dataset?',QtGui.QMessageBox.Ok | QtGui.QMessageBox.Cancel, QtGui.QMessageBox.Cancel)
-			if reply == QtGui.QMessageBox.Cancel:
-				self.statusBar().showMessage('Measurement cancelled')
-				return
-		self.meas_par = {}
-		self.data = []
-		self.colorbar_max = -float('inf')
+		#by finding which tabs are selected; None if it can't be run
+		meas_par = {}
 		try:
 			if self.movement_tab.currentWidget() == self.motor_widget:
-				self.meas_par['xf'] = float(self.xfrom_m.text())
-				self.meas_par['xt'] = float(self.xto_m.text())
-				self.meas_par['yf'] = float(self.yfrom_m.text())
-				self.meas_par['yt'] = float(self.yto_m.text())
-				self.meas_par['vr'] = float(self.readv_m.text())
+				meas_par['xf'] = float(self.xfrom_m.text())
+				meas_par['xt'] = float(self.xto_m.text())
+				meas_par['yf'] = float(self.yfrom_m.text())
+				meas_par['yt'] = float(self.yto_m.text())
+				meas_par['vr'] = float(self.readv_m.text())
 				if self.closedloop_m.isChecked() == False:
-					self.meas_par['mtype'] = 'm'
-					self.meas_par['v'] = float(self.volt_m.text())
-					self.meas_par['f'] = float(self.freq_m.text())
-					self.meas_par['c'] = float(self.clicks_m.text())
+					meas_par['mtype'] = 'm'
+					meas_par['serpentine'] = False
+					meas_par['v'] = float(self.volt_m.text())
+					meas_par['f'] = float(self.freq_m.text())
+					meas_par['c'] = float(self.clicks_m.text())
 				elif self.closedloop_m.isChecked() == True:
-					self.meas_par['mtype'] = 'M'
-					self.meas_par['n'] = float(self.numpoints_m.text())
+					meas_par['mtype'] = 'M'
+					meas_par['n'] = float(self.numpoints_m.text())
+					meas_par['serpentine'] = self.serpentine_m.isChecked()
 			elif self.movement_tab.currentWidget() == self.scanner_widget:
-				self.meas_par['mtype'] = 's'
-				self.meas_par['xf'] = float(self.xfrom_s.text())
-				self.meas_par['xt'] = float(self.xto_s.text())
-				self.meas_par['yf'] = float(self.yfrom_s.text())
-				self.meas_par['yt'] = float(self.yto_s.text())
-				self.meas_par['xv'] = float(self.xvoltstep_s.text())
-				self.meas_par['yv'] = float(self.yvoltstep_s.text())
+				meas_par['mtype'] = 's'
+				meas_par['xf'] = float(self.xfrom_s.text())
+				meas_par['xt'] = float(self.xto_s.text())
+				meas_par['yf'] = float(self.yfrom_s.text())
+				meas_par['yt'] = float(self.yto_s.text())
+				meas_par['xv'] = float(self.xvoltstep_s.text())
+				meas_par['yv'] = float(self.yvoltstep_s.text())
+				meas_par['serpentine'] = self.serpentine_s.isChecked()
+				meas_par['fly'] = self.fly_s.isChecked()
 			else:
 				self.statusBar().showMessage('Unable to identify movement type...')
-				return
+				return None
+
+			meas_par['adaptive'] = self.adaptive_a.isChecked()
+			if meas_par['adaptive']:
+				if meas_par['mtype'] == 'm':
+					self.statusBar().showMessage('Adaptive refinement needs closed-loop or scanner movement')
+					return None
+				meas_par['levels'] = int(self.levels_a.text())
+				meas_par['threshold'] = float(self.threshold_a.text())
+				meas_par['maxpoints'] = int(self.maxpoints_a.text())
+
+			meas_par['zstack'] = self.zstack_z.isChecked()
+			if meas_par['zstack']:
+				meas_par['zf'] = float(self.zfrom_z.text())
+				meas_par['zt'] = float(self.zto_z.text())
+				meas_par['zn'] = int(self.zplanes_z.text())
 
 			if self.measurement_tab.currentWidget() == self.reflec_widget:
-				self.meas_par['mtype'] += 'r'
-				self.meas_par['tm'] = float(self.meastime_r.text())
-				self.meas_par['tp'] = float(self.pausetime_r.text())
+				meas_par['mtype'] += 'r'
+				meas_par['tm'] = float(self.meastime_r.text())
+				meas_par['tp'] = float(self.pausetime_r.text())
+				meas_par['samples'] = int(self.samples_r.text())
 			elif self.measurement_tab.currentWidget() == self.count_widget:
-				self.meas_par['mtype'] += 'c'
-				self.meas_par['tm'] = float(self.meastime_c.text())
-				self.meas_par['tp'] = float(self.pausetime_c.text())
+				meas_par['mtype'] += 'c'
+				meas_par['tm'] = float(self.meastime_c.text())
+				meas_par['tp'] = float(self.pausetime_c.text())
+				meas_par['precision'] = float(self.precision_c.text())
+				meas_par['gates'] = int(self.gates_c.text())
 			else:
 				self.statusBar().showMessage('Unable to identify measurement type...')
-				return
+				return None
+			#the other detector is read alongside, with its own times
+			if self.bothdetectors.isChecked():
+				if meas_par['mtype'].endswith('r'):
+					meas_par['channels'] = ['r','c']
+					meas_par['tm_c'] = float(self.meastime_c.text())
+					meas_par['tp_c'] = float(self.pausetime_c.text())
+					meas_par['precision'] = float(self.precision_c.text())
+					meas_par['gates'] = int(self.gates_c.text())
+				else:
+					meas_par['channels'] = ['c','r']
+					meas_par['tm_r'] = float(self.meastime_r.text())
+					meas_par['tp_r'] = float(self.pausetime_r.text())
+					meas_par['samples'] = int(self.samples_r.text())
 		except ValueError as e:
 			self.statusBar().showMessage('ERROR: '+str(e))
-			return
+			return None
 
 		#pass handles through for instrumentation
-		if 'm' in self.meas_par['mtype'] or 'M' in self.meas_par['mtype']:
-			self.meas_par['mover'] = movement.findClass(self.settings['DEVICES']['motortype'])
-
-		elif 's' in self.meas_par['mtype']:
-			self.meas_par['mover'] = movement.findClass(self.settings['DEVICES']['scannertype'])
-
-		
-		if 'r' in self.meas_par['mtype']:
-			self.meas_par['measurer'] = measurement.findClass(self.settings['DEVICES']['reflectype'])
+		if not self.attachDevices(meas_par):
+			return None
+		#then check input values (ranges, etc) against the devices' tests tables
+		self.error = checkLimits(meas_par)
+		if self.error != None:
+			self.statusBar().showMessage(self.error)
+			return None
 
-		elif 'c' in self.meas_par['mtype']:
-			self.meas_par['measurer'] = measurement.findClass(self.settings['DEVICES']['countertype'])
+		return meas_par
 
-		if not any(x in self.meas_par['mover'].devicetype for x in self.meas_par['mtype']):
-			self.statusBar().showMessage('Movement device different type from expected! Check settings. Aborting...')
-			return
-		if not any(x in self.meas_par['measurer'].devicetype for x in self.meas_par['mtype']):
-			self.statusBar().showMessage('Measurement device different type from expected! Check settings. Aborting...')
+	def acquire(self):
+		if len(self.data) > 0:
+			reply = QtGui.QMessageBox.question(self,'Mapper',
+				'Overwrite existing dataset?',QtGui.QMessageBox.Ok | QtGui.QMessageBox.Cancel, QtGui.QMessageBox.Cancel)
+			if reply == QtGui.QMessageBox.Cancel:
+				self.statusBar().showMessage('Measurement cancelled')
+				return
+		meas_par = self.scanParameters()
+		if meas_par == None:
 			return
-		#then check input values (ranges, etc)
-		#tests is a series of tests to be checked against
-		self.tests = {}
-		for item in ['mover','measurer']:
-			for key in self.meas_par[item].tests.keys():
-				self.tests[key] = self.meas_par[item].tests[key]
-
-		for test_set in self.tests.keys():
-			if test_set in self.meas_par['mtype']:
-				for test in self.tests[test_set]:
-					for key in test[0]:
-						if not (test[1][0] <= self.meas_par[key] <= test[1][1]):
-							self.statusBar().showMessage(test[2]+': '+str(self.meas_par[key])+' outside limits '+str(test[1][0])+', '+str(test[1][1]))
-							return
+		self.meas_par = meas_par
+		self.data = MapperDataset(channels=len(channelsOf(meas_par)))
+		self.preview = None
+		self.colorbar_max = -float('inf')
+		if self.readConditions():
+			self.launchDrone()
 
-		#perform final metadata stuff
+	def readConditions(self):
+		#perform final metadata stuff; False if an instrument can't be read
 		if not self.manualtemp.isChecked() or not self.manualbias.isChecked():
 			self.sim900 = Sim900(self.settings['DEVICES']['sim900addr'])
 			self.sim900check = self.sim900.check()
@@ -663,7 +892,7 @@ class MapperProg(QtGui.QMainWindow):
 					self.sim900.close()
 				except:
                                         self.statusBar().showMessage('Error communicating to SIM900')
-                                        return
+                                        return False
 
 		if not self.manualatten.isChecked():
 			self.set_wavelength = None
@@ -677,16 +906,138 @@ class MapperProg(QtGui.QMainWindow):
 						self.set_wavelength = float(self.attenuator_device.query(':INP:WAV?'))
 					elif self.set_wavelength != float(self.attenuator_device.query(':INP:WAV?')):
 						self.statusBar().showMessage('Warning: attenuators disagree on wavelength!')
-						return
+						return False
 					self.attenuator_device.close()
 				else:
 					self.statusBar().showMessage('Warning: problem communicating to attenuator on: '+str(attenaddr))
-					return
+					return False
 			self.atten.setText(str(self.set_attenuation))
 			self.wavelength.setText(str(self.set_wavelength*1e9))
 		self.dateandtime.setText(time.asctime())
+		return True
+
+	def queueScan(self):
+		#adds the scan set up in the tabs, with the metadata as it is now, to the queue
+		meas_par = self.scanParameters()
+		if meas_par == None:
+			return
+		self.jobs.append({'meas_par':meas_par,'metadata':self.processMetadata()})
+		self.runQueueAction.setEnabled(self.acquireAction.isEnabled())
+		self.statusBar().showMessage(str(len(self.jobs))+' scan(s) queued')
+
+	def clearQueue(self):
+		self.jobs = []
+		self.runQueueAction.setEnabled(False)
+		self.statusBar().showMessage('Queue cleared')
+
+	def runQueue(self):
+		#runs the queued scans one after another without closing the instruments
+		#in between; each result is saved to the target folder as it finishes
+		if self.jobs == []:
+			self.statusBar().showMessage('No scans queued')
+			return
+		if self.checkNeedsSaving() == True:
+			self.statusBar().showMessage('Queue cancelled')
+			return
+		self.queue_running = True
+		self.runQueueAction.setEnabled(False)
+		self.runNextJob()
+
+	def runNextJob(self):
+		if self.jobs == [] or not self.queue_running:
+			self.finishQueue()
+			return
+		self.job = self.jobs.pop(0)
+		self.processMetadata(self.job['metadata'])
+		self.meas_par = dict(self.job['meas_par'])
+		#devices already opened by an earlier job are handed over as instances
+		self.meas_par['mover'] = self.session.get(deviceName(self.meas_par['mover']),self.meas_par['mover'])
+		self.meas_par['measurers'] = [self.session.get(deviceName(device),device) for device in self.meas_par['measurers']]
+		self.meas_par['measurer'] = self.meas_par['measurers'][0]
+		self.meas_par['session'] = True
+		self.filename = ''
+		self.setNewDataset(MapperDataset(channels=len(channelsOf(self.meas_par))))
+		self.colorbar_max = -float('inf')
+		if not self.readConditions():
+			self.finishQueue()
+			return
+		self.launchDrone()
+
+	def jobFinished(self):
+		#keeps the drone's instruments open for the next job and saves the result
+		for device in [self.mapper_drone.mover]+self.mapper_drone.measurers:
+			self.session[deviceName(device)] = device
+		self.folder = self.settings['targetfolder']
+		if not os.path.isdir(self.folder):
+			self.folder = os.path.dirname(self.folder)
+		self.filename = os.path.join(self.folder,'queued_'+time.strftime('%Y%m%d_%H%M%S')+'.json')
+		self.save()
+		QtCore.QTimer.singleShot(0,self.runNextJob)
+
+	def finishQueue(self):
+		self.queue_running = False
+		for device in self.session.values():
+			device.close()
+		self.session = {}
+		self.haltAction.setEnabled(False)
+		if not self.mapper_tool_running:
+			self.acquireAction.setEnabled(True)
+			self.resumeAction.setEnabled(True)
+			self.runQueueAction.setEnabled(self.jobs != [])
+		self.statusBar().showMessage('Queue finished; '+str(len(self.jobs))+' scan(s) left in it')
+
+	def attachDevices(self,meas_par):
+		#looks up the mover/measurer classes for meas_par in the device settings
+		meas_par['pipelined'] = self.settings['DEVICES']['pipelined']
+		self.error = findDevices(meas_par,self.settings['DEVICES'])
+		if self.error != None:
+			self.statusBar().showMessage(self.error)
+			return False
+		return True
+
+	def resume(self):
+		#carries on an interrupted map (halted, or reopened from a saved file or
+		#the rescue journal) from its first unmeasured point, adding to the same data
+		self.meas_par = getattr(self,'meas_par',{})
+		if len(self.data) == 0 or 'mtype' not in self.meas_par:
+			self.statusBar().showMessage('Nothing to resume')
+			return
+		if 'm' in self.meas_par['mtype']:
+			self.statusBar().showMessage('Open-loop maps cannot be resumed')
+			return
+		if self.meas_par.get('zstack'):
+			self.statusBar().showMessage('Z stacks cannot be resumed')
+			return
+		#devices are looked up afresh; what was saved is only their description
+		self.meas_par = dict((key,value) for key, value in self.meas_par.items() if key not in ['mover','measurer','measurers','session'])
+		self.meas_par.setdefault('serpentine',False)
+		self.meas_par.setdefault('adaptive',False)
+		self.meas_par['resume'] = True
+		if not self.attachDevices(self.meas_par):
+			return
+		self.preview = None
+		self.launchDrone()
+
+	def estimate(self):
+		#how long the scan set up in the tabs would take, without running it
+		meas_par = self.scanParameters()
+		if meas_par != None:
+			self.statusBar().showMessage(self.durationMessage(meas_par,planner.plannedPoints(meas_par)))
+
+	def durationMessage(self,meas_par,points):
+		if points == None:
+			return 'Duration of open-loop maps cannot be estimated'
+		self.duration = planner.estimateDuration(meas_par,self.settings['LATENCY'],
+												 deviceName(meas_par['mover']),deviceName(meas_par['measurer']),points)
+		if meas_par.get('adaptive'):
+			return 'Up to '+str(points)+' points, estimated at most '+planner.formatDuration(self.duration)
+		return str(points)+' points, estimated '+planner.formatDuration(self.duration)
+
+	def launchDrone(self):
 		self.haltAction.setEnabled(True)
 		self.acquireAction.setEnabled(False)
+		self.resumeAction.setEnabled(False)
+		self.runQueueAction.setEnabled(False)
 
 		#then launch the process and pass the values
 		#print 'launching in separate thread...',
@@ -696,11 +1047,25 @@ class MapperProg(QtGui.QMainWindow):
 			self.x_forward = False
 		if self.meas_par['yf']>self.meas_par['yt']:
 			self.y_forward = False
+		#names taken now, as the drone swaps the classes for instances
+		self.device_names = {'move':deviceName(self.meas_par['mover']),'readout':deviceName(self.meas_par['measurer'])}
+		self.planned_points = planner.plannedPoints(self.meas_par)
+		self.resumed_from = len(self.data)
+		if self.planned_points != None:
+			self.planned_points = max(self.planned_points,self.resumed_from)
+		self.statusBar().showMessage(self.durationMessage(self.meas_par,
+									 None if self.planned_points == None else self.planned_points-self.resumed_from))
+		#a z-stack writes its planes straight into a file of their own
+		if self.volume != None:
+			self.volume.close()
+		self.volume = None
+		if self.meas_par.get('zstack'):
+			x_steps, y_steps = planner.gridSize(self.meas_par)
+			self.volume = Volume(volume_file,(self.data.channels,self.meas_par['zn'],y_steps,x_steps))
 		self.obj_thread = QtCore.QThread()
-		self.mapper_drone = MapperDrone(self.meas_par)
+		self.mapper_drone = MapperDrone(self.meas_par,self.data,self.volume)
 		self.mapper_drone.moveToThread(self.obj_thread)
 		self.obj_thread.started.connect(self.mapper_drone.runScan)
-		self.mapper_drone.newdata.connect(self.getData)
 		self.mapper_drone.finished.connect(self.obj_thread.quit)
 		self.mapper_drone.finished.connect(self.acquisitionFinished)
 		self.mapper_drone.xSteps.connect(self.getXSteps)
@@ -708,24 +1073,134 @@ class MapperProg(QtGui.QMainWindow):
 		self.mapper_drone.writeRescueTrigger.connect(self.writeRescueData)
 		self.x_steps = None
 		self.y_steps = None
+		self.listChannels()
 		self.setNeedsSaving()
+		self.drawn = 0
+		self.journal = Journal(rescue_file,self.processMetadata(),self.settings['DEVICES']['journalsync'],convert_to_builtin_type)
+		#a resumed map carries its earlier points over into the new journal
+		dwells = self.data.dwells() or [None]*len(self.data)
+		for row, timestamp, dwell in zip(self.data.tolist(),self.data.column('timestamp').tolist(),dwells):
+			self.journal.record(row,timestamp,dwell)
+		self.data.setJournal(self.journal)
+		simclock.clock.reset()
 		self.obj_thread.start()
+		self.drain_timer.start()
 
 		#print 'launched'
 
-	def getData(self, data):
-		self.data.append(data)
-		self.updatePreviewGrid()
+	def drainData(self):
+		#the drone adds points straight to self.data; once per timer tick
+		#everything it has added since the last tick is drawn in one go
+		self.batch = self.data.since(self.drawn)
+		if self.batch != []:
+			self.drawn += len(self.batch)
+			self.addToPreview(self.batch)
+			self.showProgress()
+
+	def showProgress(self):
+		#ETA from how long the latest points of this run actually took
+		if self.planned_points == None:
+			return
+		self.eta = planner.remainingTime(self.data.column('timestamp')[self.resumed_from:],self.planned_points-len(self.data))
+		if self.eta != None:
+			self.statusBar().showMessage(str(len(self.data))+'/'+str(self.planned_points)+' points, about '+planner.formatDuration(self.eta)+' left')
 
 	def getXSteps(self,x_steps):
 		self.x_steps = x_steps
+		self.journal.note('x_steps',x_steps)
 
 	def getYSteps(self,y_steps):
 		self.y_steps = y_steps
+		self.journal.note('y_steps',y_steps)
+
+	def addToPreview(self,points):
+		#writes each new point into its pixel(s) of the preview image and
+		#blits just the image; colour limits widen with some headroom (and
+		#the blitted image takes them at once), the figure is redrawn in
+		#full for the colorbar at most every clim_redraw_interval, and laid
+		#out again only when the extent changes
+		if self.preview is None:
+			self.updatePreviewGrid()
+			return
+		self.rescale = False
+		for point in points:
+			x, y, i, j = point[:4]
+			value = point[4+self.shown]
+			self.x_range = [min(self.x_range[0],x),max(self.x_range[1],x)]
+			self.y_range = [min(self.y_range[0],y),max(self.y_range[1],y)]
+			if i >= self.preview.shape[1] or j >= self.preview.shape[0]:
+				self.updatePreviewGrid()
+				return
+			self.paintPreview(int(i),int(j),value)
+			if not (self.clim[0] <= value <= self.clim[1]):
+				span = max(self.clim[1],value)-min(self.clim[0],value)
+				if value < self.clim[0]:
+					self.clim[0] = value-clim_headroom*span
+				else:
+					self.clim[1] = value+clim_headroom*span
+				self.rescale = True
+		if self.previewExtent() != self.extent:
+			self.updatePreviewGrid()
+			return
+		self.img.changed()
+		if self.rescale:
+			self.img.set_clim(*self.clim)
+			self.preview_stale = True
+		self.showPreview()
+
+	def showPreview(self,force=False):
+		#blits the image, or redraws the figure if the colorbar is out of
+		#date and the last full redraw is long enough ago (or force)
+		if self.preview_stale and (force or time.time()-self.full_drawn >= clim_redraw_interval):
+			self.canvas.draw()
+			self.full_drawn = time.time()
+			self.preview_stale = False
+		else:
+			self.ax.draw_artist(self.img)
+			for spine in self.ax.spines.values():
+				self.ax.draw_artist(spine)
+			self.canvas.blit(self.ax.bbox)
+
+	def paintPreview(self,i,j,value):
+		#the preview is stored flipped to suit imshow, so (i, j) is mapped
+		#to display rows/columns; adaptive points cover a block of pixels
+		self.block = 1
+		if self.preview_levels > 0:
+			coarse = 2**self.preview_levels
+			self.block = min(i & -i or coarse, j & -j or coarse, coarse)
+		lo_i = max(i-self.block//2,0)
+		lo_j = max(j-self.block//2,0)
+		ny, nx = self.preview.shape
+		if self.x_forward:
+			self.cols = slice(lo_i,lo_i+self.block)
+		else:
+			self.cols = slice(max(nx-lo_i-self.block,0),nx-lo_i)
+		if self.y_forward:
+			self.rows = slice(max(ny-lo_j-self.block,0),ny-lo_j)
+		else:
+			self.rows = slice(lo_j,lo_j+self.block)
+		self.preview[self.rows,self.cols] = value
+
+	def previewExtent(self):
+		self.new_extent = [self.x_range[0],self.x_range[1],self.y_range[0],self.y_range[1]]
+		if self.x_steps != None:
+			self.new_extent[1] = max([self.x_range[1],self.meas_par['xt'],self.meas_par['xf']])
+			self.new_extent[0] = min([self.x_range[0],self.meas_par['xt'],self.meas_par['xf']])
+			if self.y_steps != None:
+				self.new_extent[3] = max([self.y_range[1],self.meas_par['yt'],self.meas_par['yf']])
+				self.new_extent[2] = min([self.y_range[0],self.meas_par['yt'],self.meas_par['yf']])
+		if self.new_extent[2] == self.new_extent[3]:
+			self.new_extent[3] += 0.000001
+		if self.new_extent[0] == self.new_extent[1]:
+			self.new_extent[1] += 0.000001
+		return self.new_extent
 
 	def updatePreviewGrid(self):
+		#rebuilds the whole preview from self.data; addToPreview then keeps it
+		#up to date a point at a time
 		plt.figure('preview')
-		self.data_array = np.array(self.data).transpose()
+		self.x_data = self.data.column('x')
+		self.y_data = self.data.column('y')
 		if any(x in 'mM' for x in self.meas_par['mtype']):
 			self.ax.set_xlabel('X position (mm)')
 			self.ax.set_ylabel('Y position (mm)')
@@ -733,40 +1208,52 @@ class MapperProg(QtGui.QMainWindow):
 			self.ax.set_xlabel('X position (V)')
 			self.ax.set_ylabel('Y position (V)')
 
-
-		self.extent = [self.data_array[0].min(), self.data_array[0].max(), self.data_array[1].min(),self.data_array[1].max()]
-		if self.x_steps != None:
-			self.z_data = [list(self.data_array[4][x:x+self.x_steps]) for x in range(0,len(self.data_array[4]),self.x_steps)]
-			if len(self.z_data[-1]) < self.x_steps:
-				self.z_data[-1] += [np.nan]*(self.x_steps - len(self.z_data[-1]))
-			self.extent[1] = max([self.data_array[0].max(),self.meas_par['xt'],self.meas_par['xf']])
-			self.extent[0] = min([self.data_array[0].min(),self.meas_par['xt'],self.meas_par['xf']])
-			if self.y_steps != None and len(self.z_data) < self.y_steps:
-				self.z_data += [[np.nan]*self.x_steps]*(self.y_steps-len(self.z_data))
-				self.extent[3] = max([self.data_array[1].max(),self.meas_par['yt'],self.meas_par['yf']])
-				self.extent[2] = min([self.data_array[1].min(),self.meas_par['yt'],self.meas_par['yf']])
-		else:
-			self.z_data = [list(self.data_array[4])]
-		if self.extent[2] == self.extent[3]:
-			self.extent[3] += 0.000001
-		if self.extent[0] == self.extent[1]:
-			self.extent[1] += 0.000001
+		self.x_range = [self.x_data.min(),self.x_data.max()]
+		self.y_range = [self.y_data.min(),self.y_data.max()]
+		self.extent = self.previewExtent()
+		self.preview_levels = adaptiveLevels(self.meas_par)
+		self.z_data = gridFromData(self.data,self.x_steps,self.y_steps,self.preview_levels,
+								   None if self.shown == 0 else self.data.channel(self.shown))
 
 		#correct for swapped .extents()
 		if not self.x_forward:
-			for r, row in enumerate(self.z_data):
-				self.z_data[r] = row[::-1]
+			self.z_data = self.z_data[:,::-1]
 		if self.y_forward:
 			self.z_data = self.z_data[::-1]
+		self.clim = [np.nanmin(self.z_data),np.nanmax(self.z_data)]
 		try:
-			self.img.set_data(self.z_data)
-			self.img.autoscale()
+			self.img.set_data(np.ma.masked_invalid(self.z_data))
 			self.img.set_extent(self.extent)
 		except AttributeError:
-			self.img = plt.imshow(self.z_data,extent=self.extent, interpolation='nearest',cmap=colormaps.viridis, aspect='auto')
+			self.img = plt.imshow(np.ma.masked_invalid(self.z_data),extent=self.extent, interpolation='nearest',cmap=colormaps.viridis, aspect='auto')
 			self.cbar = plt.colorbar()
+		self.img.set_clim(*self.clim)
+		#written into in place by addToPreview
+		self.preview = self.img.get_array()
 		self.fig.tight_layout()
 		self.canvas.draw()
+		self.full_drawn = time.time()
+		self.preview_stale = False
+
+	def listChannels(self):
+		#offers the detector channels of the current map in the toolbar
+		meas_par = getattr(self,'meas_par',None)
+		channels = []
+		if meas_par and 'mtype' in meas_par:
+			channels = channelsOf(meas_par)[:self.data.channels]
+		self.channel_select.blockSignals(True)
+		self.channel_select.clear()
+		self.channel_select.addItems([channel_names[channel] for channel in channels])
+		if self.shown >= len(channels):
+			self.shown = 0
+		self.channel_select.setCurrentIndex(self.shown)
+		self.channel_select.blockSignals(False)
+		self.channel_select.setEnabled(len(channels) > 1)
+
+	def showChannel(self,index=None):
+		self.shown = max(self.channel_select.currentIndex(),0)
+		if len(self.data) > 0:
+			self.updatePreviewGrid()
 
 	def flipColorbar(self):
 		try:
@@ -779,7 +1266,7 @@ class MapperProg(QtGui.QMainWindow):
 		try:
 			self.canvas
 		except AttributeError:
-			self.data = np.array([[]])
+			self.data = MapperDataset()
 			self.fig = plt.figure('preview',figsize = (4.5,4), dpi=72, facecolor=(1,1,1), edgecolor=(0,0,0))
 			self.ax = self.fig.add_subplot(1,1,1)
 			#self.plot = plt.tricontourf(self.data)#*self.data)
@@ -791,20 +1278,41 @@ class MapperProg(QtGui.QMainWindow):
 	def startAcquisition(self):
 		if not self.mapper_tool_running:
 			self.acquireAction.setEnabled(False)
+			self.resumeAction.setEnabled(False)
 			self.haltAction.setEnabled(False)
 			self.acquire()
 		else:
 			self.statusBar().showMessage('Mapper Tool has priority')
 
 	def acquisitionFinished(self):
-		if not self.mapper_tool_running:
+		self.drain_timer.stop()
+		self.drainData()
+		if self.preview is not None and self.preview_stale:
+			self.showPreview(True)
+		self.data.setJournal(None)
+		self.journal.close()
+		#remember how long this mover and measurer took, for later estimates
+		for phase in ['move','readout']:
+			total, count = self.mapper_drone.latency[phase]
+			if count > 0:
+				planner.updateHistory(self.settings['LATENCY'],self.device_names[phase],phase,max(0.0,total/count))
+		setSettings(self.settings)
+		if simclock.clock.virtual:
+			self.statusBar().showMessage('Finished; the fake instruments would have taken '+planner.formatDuration(simclock.clock.elapsed()))
+		if self.meas_par.get('session'):
+			#part of a queue (if halted, the queue stops once this is saved)
+			self.jobFinished()
+		elif not self.mapper_tool_running:
 			self.haltAction.setEnabled(False)
 			self.acquireAction.setEnabled(True)
+			self.resumeAction.setEnabled(True)
+			self.runQueueAction.setEnabled(self.jobs != [])
 		else:
 			self.statusBar().showMessage('Mapper Tool has priority')
 
 	def acquisitionRunning(self):
 		self.acquireAction.setEnabled(False)
+		self.resumeAction.setEnabled(False)
 		self.haltAction.setEnabled(True)
 
 	def new(self,save_already_checked = False):
@@ -816,7 +1324,7 @@ class MapperProg(QtGui.QMainWindow):
 	def newSequential(self,save_already_checked=False):
 		if save_already_checked == True or self.checkNeedsSaving() == False:
 			self.filename = ''
-			self.setNewDataset([])
+			self.setNewDataset(MapperDataset())
 			self.meas_par = None
 			self.dateandtime.setText('')
 			self.setNeedsSaving(reset=True)
@@ -824,7 +1332,7 @@ class MapperProg(QtGui.QMainWindow):
 			self.statusBar().showMessage('Begun next dataset')
 
 	def open(self):
-		self.filename_open, _ = QtGui.QFileDialog.getOpenFileName(self,'Open file...',self.settings['targetfolder'],"Mapper data (*.json);;All data (*.*)")
+		self.filename_open, _ = QtGui.QFileDialog.getOpenFileName(self,'Open file...',self.settings['targetfolder'],"Mapper data (*.json);;Rescue journal (*.jsonl);;All data (*.*)")
 		if self.checkNeedsSaving() == False:
 			if self.filename_open != '':
 				#self.new(True)
@@ -832,7 +1340,10 @@ class MapperProg(QtGui.QMainWindow):
 				self.settings['targetfolder'] = self.filename
 				with open(self.filename,'r') as f:
 					try:
-						self.loaded_data = json.loads(f.read())
+						if self.filename.endswith('.jsonl'):
+							self.loaded_data = readJournal(self.filename)
+						else:
+							self.loaded_data = json.loads(f.read())
 					except ValueError as e:
 						self.statusBar().showMessage('Problem loading file '+str(self.filename))
 						reply = QtGui.QMessageBox.question(self,'Mapper', 'Problem loading '+str(self.filename)+':\n'+str(e),
@@ -840,12 +1351,17 @@ class MapperProg(QtGui.QMainWindow):
 						return
 				try:
 					self.processMetadata(self.loaded_data['metadata'])
-					self.setNewDataset(self.loaded_data['data'])
+					self.setNewDataset(MapperDataset(self.loaded_data['data'],self.loaded_data.get('timestamps'),self.loaded_data.get('dwell')))
+					if 'volume' in self.loaded_data:
+						self.volume = Volume(os.path.join(os.path.dirname(self.filename),self.loaded_data['volume']))
 				except KeyError as e:
 					self.statusBar().showMessage('Problem loading file '+str(self.filename))
 					reply = QtGui.QMessageBox.question(self,'Mapper', 'Problem loading '+str(self.filename)+':\n'+str(e),
 							QtGui.QMessageBox.Ok)
 					return
+				except IOError as e:
+					#the map itself is still there to look at
+					self.statusBar().showMessage('Z stack of '+str(self.filename)+' not found: '+str(e))
 
 
 				try:
@@ -862,13 +1378,23 @@ class MapperProg(QtGui.QMainWindow):
 					pass
 
 
-				self.setNeedsSaving(reset=True)
-				self.statusBar().showMessage('Loaded '+str(self.filename))
+				if self.filename.endswith('.jsonl'):
+					#recovered data still needs saving as a proper data file
+					self.filename = ''
+					self.setNeedsSaving()
+				else:
+					self.setNeedsSaving(reset=True)
+				self.statusBar().showMessage('Loaded '+str(self.filename_open))
 				self.updateWindowTitle()
 
 	def setNewDataset(self,data):
 		self.data = data
-		if self.data != []:
+		if self.volume != None:
+			self.volume.close()
+		self.volume = None
+		self.preview = None
+		self.listChannels()
+		if len(self.data) > 0:
 			self.updatePreviewGrid()
 		else:
 			try:
@@ -882,8 +1408,10 @@ class MapperProg(QtGui.QMainWindow):
 		if self.filename == '':
 			self.saveAs()
 		else:
+			if self.volume != None:
+				self.saveVolume()
 			with open(self.filename,'w') as f:
-				f.write(json.dumps({'metadata':self.processMetadata(),'data':self.data},default=convert_to_builtin_type))
+				f.write(json.dumps(self.fileContents(),default=convert_to_builtin_type))
 			self.statusBar().showMessage('Saved to '+str(self.filename))
 			self.updateWindowTitle()
 			self.setNeedsSaving(reset=True)
@@ -894,9 +1422,28 @@ class MapperProg(QtGui.QMainWindow):
 			self.folder_for_dialogs = self.filename
 			self.save()
 
+	def saveVolume(self):
+		#the z-stack goes next to the data file, with the same name
+		self.volume_path = os.path.splitext(self.filename)[0]+'.npy'
+		self.volume.flush()
+		if os.path.abspath(self.volume_path) != os.path.abspath(self.volume.path):
+			shutil.copyfile(self.volume.path,self.volume_path)
+
 	def writeRescueData(self):
-		with open('rescued.json','w') as f:
-			f.write(json.dumps({'metadata':self.processMetadata(),'data':self.data},default=convert_to_builtin_type))
+		#points are journalled as they arrive; make sure each finished row is on disk
+		self.journal.sync()
+
+	def fileContents(self):
+		contents = {'metadata':self.processMetadata(),
+					'data':self.data.tolist(),
+					'timestamps':self.data.column('timestamp').tolist()}
+		#counters set to a precision record how long each point took
+		dwells = self.data.dwells()
+		if dwells != None:
+			contents['dwell'] = dwells
+		if self.volume != None:
+			contents['volume'] = os.path.basename(os.path.splitext(self.filename)[0]+'.npy')
+		return contents
 
 	def updateWindowTitle(self):
 		if self.filename == '':
@@ -906,10 +1453,11 @@ class MapperProg(QtGui.QMainWindow):
 
 	def halt(self):
 		self.mapper_drone.abort = True
+		self.queue_running = False
 		self.haltAction.setEnabled(False)
 
 	def plotExternal(self):
-		self.plotWindow = MapperPlot(self.data,self.processMetadata(),self.settings,self.filename)
+		self.plotWindow = MapperPlot(self.data,self.processMetadata(),self.settings,self.filename,self.volume)
 		self.plotWindow.setWindowModality(QtCore.Qt.WindowModality.ApplicationModal)
 		self.plotWindow.hide()
 		self.plotWindow.show()
@@ -969,16 +1517,31 @@ class MapperProg(QtGui.QMainWindow):
 				'clicks_m':self.clicks_m.text(),
 				'numpoints_m':self.numpoints_m.text(),
 				'closedloop_m':self.closedloop_m.isChecked(),
+				'serpentine_m':self.serpentine_m.isChecked(),
 				'xfrom_s':self.xfrom_s.text(),
 				'xto_s':self.xto_s.text(),
 				'yfrom_s':self.yfrom_s.text(),
 				'yto_s':self.yto_s.text(),
 				'xvoltstep_s':self.xvoltstep_s.text(),
 				'yvoltstep_s':self.yvoltstep_s.text(),
+				'serpentine_s':self.serpentine_s.isChecked(),
+				'fly_s':self.fly_s.isChecked(),
+				'adaptive_a':self.adaptive_a.isChecked(),
+				'levels_a':self.levels_a.text(),
+				'threshold_a':self.threshold_a.text(),
+				'maxpoints_a':self.maxpoints_a.text(),
+				'zstack_z':self.zstack_z.isChecked(),
+				'zfrom_z':self.zfrom_z.text(),
+				'zto_z':self.zto_z.text(),
+				'zplanes_z':self.zplanes_z.text(),
 				'meastime_c':self.meastime_c.text(),
 				'pausetime_c':self.pausetime_c.text(),
+				'precision_c':self.precision_c.text(),
+				'gates_c':self.gates_c.text(),
 				'meastime_r':self.meastime_r.text(),
-				'pausetime_r':self.pausetime_r.text()
+				'pausetime_r':self.pausetime_r.text(),
+				'samples_r':self.samples_r.text(),
+				'bothdetectors':self.bothdetectors.isChecked()
 				}
 
 			try:
@@ -995,7 +1558,7 @@ class MapperProg(QtGui.QMainWindow):
 	def export(self):
 		self.clipboard = QtGui.QApplication.clipboard()
 		self.clipboard_string = ''
-		for row in self.data:#
+		for row in self.data.tolist():#
 			for col in row:
 				self.clipboard_string += str(col) +'\t'
 			self.clipboard_string = self.clipboard_string[:-1] +'\n'
@@ -1005,6 +1568,7 @@ class MapperProg(QtGui.QMainWindow):
 	def openSettings(self):
 		self.settings_window = SettingsDialog(self.settings,movement.findClass(),measurement.findClass())
 		self.settings_window.exec_()
+		simclock.clock.setVirtual(self.settings['DEVICES']['virtualclock'])
 
 
 	def helpFile(self):
@@ -1035,7 +1599,9 @@ class MapperProg(QtGui.QMainWindow):
 		except AttributeError:
 			pass
 		self.acquireAction.setEnabled(False)
+		self.resumeAction.setEnabled(False)
 		self.toolWindow.aboutToQuit.connect(self.acquireAction.setEnabled)
+		self.toolWindow.aboutToQuit.connect(self.resumeAction.setEnabled)
 		self.toolWindow.aboutToQuit.connect(self.mapperToolClosed)
 
 	def mapperToolClosed(self):
@@ -1071,6 +1637,11 @@ class MapperTool(QtGui.QMainWindow):
 
 		#finalize things
 		self.data = []
+		self.accumulating = False
+		self.mean = None
+		self.drain_timer = QtCore.QTimer(self)
+		self.drain_timer.setInterval(refresh_interval)
+		self.drain_timer.timeout.connect(self.drainData)
 		self.setWindowTitle('Mapper Tools')
 		self.setWindowIcon(QtGui.QIcon(r'icons\tool.png'))
 		self.statusBar().showMessage('Ready...')
@@ -1124,6 +1695,12 @@ class MapperTool(QtGui.QMainWindow):
 		self.xvoltstep_s = QtGui.QLineEdit('1')
 		self.yvoltstep_s = QtGui.QLineEdit('1')
 		self.scan = QtGui.QPushButton('Run')
+		self.accumulate_s = QtGui.QCheckBox('Accumulate')
+		self.frames_s = QtGui.QSpinBox()
+		self.frames_s.setRange(2,100)
+		self.frames_s.setValue(10)
+		self.show_s = QtGui.QComboBox()
+		self.show_s.addItems(['Latest','Average','Difference'])
 
 		self.scan_grid.addWidget(QtGui.QLabel('X range:'),1,0)
 		self.scan_grid.addWidget(self.xfrom_s,1,1)
@@ -1139,9 +1716,16 @@ class MapperTool(QtGui.QMainWindow):
 		self.scan_grid.addWidget(QtGui.QLabel('Y step:'),3,2)
 		self.scan_grid.addWidget(self.yvoltstep_s,3,3)
 
-		self.scan_grid.addWidget(self.scan,4,0,1,4)
+		self.scan_grid.addWidget(self.accumulate_s,4,0,1,2)
+		self.scan_grid.addWidget(QtGui.QLabel('Frames:'),4,2)
+		self.scan_grid.addWidget(self.frames_s,4,3)
+		self.scan_grid.addWidget(QtGui.QLabel('Show:'),5,0)
+		self.scan_grid.addWidget(self.show_s,5,1,1,3)
+
+		self.scan_grid.addWidget(self.scan,6,0,1,4)
 
 		self.scan.clicked.connect(self.runButtonToggle)
+		self.show_s.currentIndexChanged.connect(self.updatePreviewGrid)
 		self.move.clicked.connect(self.moveTo)
 
 	def checkForGraph(self):
@@ -1160,6 +1744,8 @@ class MapperTool(QtGui.QMainWindow):
 		self.sMeas_par = {}
 		self.data = []
 		self.colorbar_max = -float('inf')
+		self.accumulating = self.accumulate_s.isChecked()
+		self.mean = None
 		try:
 			self.sMeas_par['mtype'] = 'usr'
 			self.sMeas_par['xf'] = float(self.xfrom_s.text())
@@ -1208,9 +1794,10 @@ class MapperTool(QtGui.QMainWindow):
 			self.y_forward = False
 		self.scanobj_thread = QtCore.QThread()
 		self.scan_drone = ScanDrone(self.sMeas_par)
+		self.accumulate_s.setEnabled(False)
+		self.frames_s.setEnabled(False)
 		self.scan_drone.moveToThread(self.scanobj_thread)
 		self.scanobj_thread.started.connect(self.scan_drone.runScan)
-		self.scan_drone.scannewdata.connect(self.getData)
 		self.scan_drone.scanfinished.connect(self.scanobj_thread.quit)
 		self.scan_drone.scanfinished.connect(self.acquisitionFinished)
 		self.scan_drone.scanxSteps.connect(self.getXSteps)
@@ -1218,16 +1805,98 @@ class MapperTool(QtGui.QMainWindow):
 		self.x_steps = None
 		self.y_steps = None
 		self.scanobj_thread.start()
+		self.drain_timer.start()
 		self.scan.setText('Stop')
 		self.scan.setEnabled(True)
 		#print 'launched'
 
-	def getData(self, data):
-		try:
-			self.data[data[0]] = data[1:]
-		except IndexError:
-			self.data.append(data[1:])
-		self.updatePreviewGrid()
+	def drainData(self):
+		#applies everything the drone has queued since the last tick, then redraws once
+		self.batch = 0
+		while True:
+			try:
+				data = self.scan_drone.queue.popleft()
+			except IndexError:
+				break
+			if self.accumulating and self.mean is None:
+				if self.x_steps == None or self.y_steps == None:
+					#frame size not known yet; leave it for the next tick
+					self.scan_drone.queue.appendleft(data)
+					break
+				self.startAccumulation()
+			try:
+				self.data[data[0]] = data[1:]
+			except IndexError:
+				self.data.append(data[1:])
+			if self.accumulating:
+				self.accumulate(data)
+			self.batch += 1
+		if self.batch > 0:
+			self.updatePreviewGrid()
+
+	def startAccumulation(self):
+		#running per-pixel mean/M2 (Welford) over every frame, the frame being
+		#scanned and a ring of the last few finished ones, all allocated once
+		shape = (self.y_steps,self.x_steps)
+		self.count = np.zeros(shape)
+		self.mean = np.zeros(shape)
+		self.m2 = np.zeros(shape)
+		self.frame = np.empty(shape)
+		self.frame.fill(np.nan)
+		self.frame_points = 0
+		self.frames = 0
+		self.ring = np.empty((self.frames_s.value(),)+shape)
+		self.ring_head = 0
+		self.ring_frames = 0
+
+	def accumulate(self,data):
+		counter, i, j, value = data[0], data[3], data[4], data[5]
+		if counter == 0 and self.frame_points > 0:
+			self.endFrame()
+		self.frame[j,i] = value
+		self.frame_points += 1
+		self.count[j,i] += 1
+		delta = value - self.mean[j,i]
+		self.mean[j,i] += delta/self.count[j,i]
+		self.m2[j,i] += delta*(value - self.mean[j,i])
+
+	def endFrame(self):
+		#the finished frame overwrites the oldest one in the ring
+		self.ring[self.ring_head] = self.frame
+		self.ring_head = (self.ring_head+1) % len(self.ring)
+		self.ring_frames = min(self.ring_frames+1,len(self.ring))
+		self.frame.fill(np.nan)
+		self.frame_points = 0
+		self.frames += 1
+		repeated = self.count > 1
+		if repeated.any():
+			noise = np.sqrt(self.m2[repeated]/(self.count[repeated]-1)).mean()
+			self.statusBar().showMessage('Frame '+str(self.frames)+', mean std. dev. per pixel '+str(noise))
+		else:
+			self.statusBar().showMessage('Frame '+str(self.frames))
+
+	def variance(self):
+		#per-pixel sample variance over all frames (nan until measured twice)
+		variance = np.empty(self.count.shape)
+		variance.fill(np.nan)
+		repeated = self.count > 1
+		variance[repeated] = self.m2[repeated]/(self.count[repeated]-1)
+		return variance
+
+	def displayedFrame(self):
+		#array for the 'Show' choice, or None to draw the latest values as they come
+		if not self.accumulating or self.mean is None:
+			return None
+		show = self.show_s.currentText()
+		if show == 'Average':
+			average = np.empty(self.count.shape)
+			average.fill(np.nan)
+			measured = self.count > 0
+			average[measured] = self.mean[measured]
+			return average
+		elif show == 'Difference' and self.ring_frames > 0:
+			return self.frame - self.ring[(self.ring_head-1) % len(self.ring)]
+		return None
 
 	def getXSteps(self,x_steps):
 		self.x_steps = x_steps
@@ -1236,6 +1905,8 @@ class MapperTool(QtGui.QMainWindow):
 		self.y_steps = y_steps
 
 	def updatePreviewGrid(self):
+		if len(self.data) == 0:
+			return
 		try:
 			plt.figure('scanview')
 			self.data_array = np.array(self.data).transpose()
@@ -1243,15 +1914,21 @@ class MapperTool(QtGui.QMainWindow):
 			self.ax.set_ylabel('Y position (V)')
 
 			self.extent = [self.data_array[0].min(), self.data_array[0].max(), self.data_array[1].min(),self.data_array[1].max()]
-			self.z_data = [list(self.data_array[4][x:x+self.x_steps]) for x in range(0,len(self.data_array[4]),self.x_steps)]
-			if len(self.z_data[-1]) < self.x_steps:
-				self.z_data[-1] += [np.nan]*(self.x_steps - len(self.z_data[-1]))
 			self.extent[1] = max([self.data_array[0].max(),self.sMeas_par['xt'],self.sMeas_par['xf']])
 			self.extent[0] = min([self.data_array[0].min(),self.sMeas_par['xt'],self.sMeas_par['xf']])
-			if self.y_steps != None and len(self.z_data) < self.y_steps:
-				self.z_data += [[np.nan]*self.x_steps]*(self.y_steps-len(self.z_data))
+			frame = self.displayedFrame()
+			if frame is not None:
+				self.z_data = [list(row) for row in frame]
 				self.extent[3] = max([self.data_array[1].max(),self.sMeas_par['yt'],self.sMeas_par['yf']])
 				self.extent[2] = min([self.data_array[1].min(),self.sMeas_par['yt'],self.sMeas_par['yf']])
+			else:
+				self.z_data = [list(self.data_array[4][x:x+self.x_steps]) for x in range(0,len(self.data_array[4]),self.x_steps)]
+				if len(self.z_data[-1]) < self.x_steps:
+					self.z_data[-1] += [np.nan]*(self.x_steps - len(self.z_data[-1]))
+				if self.y_steps != None and len(self.z_data) < self.y_steps:
+					self.z_data += [[np.nan]*self.x_steps]*(self.y_steps-len(self.z_data))
+					self.extent[3] = max([self.data_array[1].max(),self.sMeas_par['yt'],self.sMeas_par['yf']])
+					self.extent[2] = min([self.data_array[1].min(),self.sMeas_par['yt'],self.sMeas_par['yf']])
 
 
 			#correct for swapped .extents()
@@ -1273,6 +1950,11 @@ class MapperTool(QtGui.QMainWindow):
 			pass
 
 	def acquisitionFinished(self):
+		if self.drain_timer.isActive():
+			self.drain_timer.stop()
+			self.drainData()
+		self.accumulate_s.setEnabled(True)
+		self.frames_s.setEnabled(True)
 		self.scan.setText('Run')
 		self.scan.setEnabled(True)
 
@@ -1361,141 +2043,33 @@ class MapperTool(QtGui.QMainWindow):
 		self.aboutToQuit.emit(True)
 		event.accept()
 
-class MapperDrone(QtCore.QObject):
-	def __init__(self,meas_par):
-		super(MapperDrone,self).__init__()
+class MapperDrone(QtCore.QObject,ScanEngine):
+	def __init__(self,meas_par,dataset=None,volume=None):
+		QtCore.QObject.__init__(self)
 		#handle stuff passed in
-		self.abort = False
-		self.meas_par = meas_par
+		ScanEngine.__init__(self,meas_par,dataset,volume)
 		
 	finished = QtCore.Signal()
-	newdata = QtCore.Signal(list)
 	aborted = QtCore.Signal()
 	xSteps = QtCore.Signal(int)
 	ySteps = QtCore.Signal(int)
 	writeRescueTrigger = QtCore.Signal()
 
-	def runScan(self):
-		self.init() #readies mover/measurer
-		self.mover.moveTo('x',self.meas_par['xf'])
-		self.mover.moveTo('y',self.meas_par['yf'])
-		#print 'homed to:',self.mover.getPos()
-		self.xgoesup = self.meas_par['xt'] > self.meas_par['xf']
-		self.ygoesup = self.meas_par['yt'] > self.meas_par['yf']
-		self.dataset = []
-		if 'M' in self.meas_par['mtype'] or 's' in self.meas_par['mtype']:
-			self.runClosedLoopMap()
-		elif 'm' in self.meas_par['mtype']:
-			self.runOpenLoopMap()
+	#the scan itself is ScanEngine's; its progress hooks become signals
+	def foundXSteps(self,x_steps):
+		self.xSteps.emit(x_steps)
 
-		self.mover.moveTo('x',self.meas_par['xf'])
-		self.mover.moveTo('y',self.meas_par['yf'])
-		self.mover.close()
-		self.measurer.close()
-		self.finished.emit()
+	def foundYSteps(self,y_steps):
+		self.ySteps.emit(y_steps)
 
-	def runClosedLoopMap(self):
-		for j, y_step in enumerate(self.y_steplist):
-			self.mover.moveTo('y',y_step)
-			for i, x_step in enumerate(self.x_steplist):
-				self.mover.moveTo('x',x_step)
-				self.pos = self.mover.getPos()
-				self.meas = self.measurer.getMeasurement()
-				self.dataset.append([self.pos['x'],self.pos['y'],i,j,self.meas])
-				self.newdata.emit(self.dataset[-1])
-				if self.abort == True:
-					self.aborted.emit()
-					return
-			self.writeRescueTrigger.emit()
-			if self.abort == True:
-				self.aborted.emit()
-				return	
+	def rowDone(self):
+		self.writeRescueTrigger.emit()
 
-	def runOpenLoopMap(self):
-		self.step = {'x':0,'y':0}
-		while True:
-			while True:
-				self.pos = self.mover.getPos()
-				if (self.x_steps == float('inf') and self.xgoesup and self.pos['x'] > self.meas_par['xt']) or (
-				   self.x_steps == float('inf') and not self.xgoesup and self.pos['x'] < self.meas_par['xt']):
-					self.x_steps = self.step['x']
-					self.xSteps.emit(int(self.x_steps)+1)
-				self.meas = self.measurer.getMeasurement()
-				self.dataset.append([self.pos['x'],self.pos['y'],self.step['x'],self.step['y'],self.meas])
-				self.newdata.emit(self.dataset[-1])
-				if self.step['x'] >= self.x_steps:
-					break
-				self.step['x'] += 1
-				if self.xgoesup: #if xto > xfrom:
-					self.mover.moveUp('x')
-				else:
-					self.mover.moveDown('x')
-				if self.abort == True:
-					self.aborted.emit()
-					return
+	def scanAborted(self):
+		self.aborted.emit()
 
-			self.writeRescueTrigger.emit()
-			self.step['x']=0
-			if (self.y_steps == float('inf') and self.ygoesup and self.pos['y'] > self.meas_par['yt']) or (
-			   self.y_steps == float('inf') and not self.ygoesup and self.pos['y'] < self.meas_par['yt']):
-				self.y_steps = self.step['y']
-				self.ySteps.emit(int(self.y_steps))
-				break
-
-			self.mover.moveTo('x',self.meas_par['xf'])
-			self.step['y']+=1
-			if self.ygoesup: #if xto > xfrom:
-				self.mover.moveUp('y')
-			else:
-				self.mover.moveDown('y')
-
-			if self.abort == True:
-				self.aborted.emit()
-				return
-
-
-	def init(self):
-		#instantiate instrumentation (that has now passed the tests)
-		try:
-			self.meas_par['mover'] = self.meas_par['mover']()
-			self.meas_par['measurer'] = self.meas_par['measurer']()
-		except:
-			print 'Problem instantiating mover/measurer!'
-			self.finished.emit()
-		self.mover = self.meas_par['mover']
-		self.measurer = self.meas_par['measurer']
-
-		#perform setup of devices
-		if 'm' in self.meas_par['mtype']:
-			self.mover.setDefaults( self.meas_par['v'],
-									self.meas_par['f'],
-									self.meas_par['c'],
-									self.meas_par['vr'])
-			self.x_steps = float('inf')
-			self.y_steps = float('inf')
-		elif 'M' in self.meas_par['mtype']:
-			self.mover.setClosedCircuitDefaults(1000,self.meas_par['vr'])
-			self.x_steps = self.meas_par['n']+1
-			self.y_steps = self.meas_par['n']+1
-			self.xSteps.emit(int(self.x_steps))
-			self.ySteps.emit(int(self.y_steps))
-			self.x_steplist = np.linspace(self.meas_par['xf'],self.meas_par['xt'],self.x_steps)
-			self.y_steplist = np.linspace(self.meas_par['yf'],self.meas_par['yt'],self.y_steps)
-		elif 's' in self.meas_par['mtype']:
-			self.mover.setDefaults(	self.meas_par['xv'],
-									self.meas_par['yv'])
-			self.x_steps = (abs(self.meas_par['xt']-self.meas_par['xf'])/self.meas_par['xv'])+1
-			self.y_steps = (abs(self.meas_par['yt']-self.meas_par['yf'])/self.meas_par['yv'])+1
-			self.x_steplist = np.linspace(self.meas_par['xf'],self.meas_par['xt'],self.x_steps)
-			self.y_steplist = np.linspace(self.meas_par['yf'],self.meas_par['yt'],self.y_steps)
-			self.xSteps.emit(int(self.x_steps))
-			self.ySteps.emit(int(self.y_steps))
-		if 'r' in self.meas_par['mtype']:
-			self.measurer.setDefaults(	self.meas_par['tm'],
-										self.meas_par['tp'])
-		elif 'c' in self.meas_par['mtype']:
-			self.measurer.setDefaults(	self.meas_par['tm'],
-										self.meas_par['tp'])
+	def scanFinished(self):
+		self.finished.emit()
 	
 class ScanDrone(QtCore.QObject):
 	def __init__(self,sMeas_par):
@@ -1503,17 +2077,16 @@ class ScanDrone(QtCore.QObject):
 		#handle stuff passed in
 		self.abort = False
 		self.sMeas_par = sMeas_par
+		self.queue = collections.deque()
 		
 	scanfinished = QtCore.Signal()
-	scannewdata = QtCore.Signal(list)
 	scanaborted = QtCore.Signal()
 	scanxSteps = QtCore.Signal(int)
 	scanySteps = QtCore.Signal(int)
 
 	def runScan(self):
 		self.init() #readies mover/measurer
-		self.mover.moveTo('x',self.sMeas_par['xf'])
-		self.mover.moveTo('y',self.sMeas_par['yf'])
+		self.mover.moveToXY(self.sMeas_par['xf'],self.sMeas_par['yf'])
 		#print 'homed to:',self.mover.getPos()
 		self.xgoesup = self.sMeas_par['xt'] > self.sMeas_par['xf']
 		self.ygoesup = self.sMeas_par['yt'] > self.sMeas_par['yf']
@@ -1522,8 +2095,7 @@ class ScanDrone(QtCore.QObject):
 		if 'u' in self.sMeas_par['mtype']:
 			self.runRepeatingMap()
 
-		self.mover.moveTo('x',self.sMeas_par['xf'])
-		self.mover.moveTo('y',self.sMeas_par['yf'])
+		self.mover.moveToXY(self.sMeas_par['xf'],self.sMeas_par['yf'])
 		self.mover.close()
 		self.measurer.close()
 		self.scanfinished.emit()
@@ -1532,12 +2104,15 @@ class ScanDrone(QtCore.QObject):
 		while True:
 			self.counter = 0
 			for j, y_step in enumerate(self.y_steplist):
-				self.mover.moveTo('y',y_step)
 				for i, x_step in enumerate(self.x_steplist):
-					self.mover.moveTo('x',x_step)
+					#the row's first point is reached on both axes at once
+					if i == 0:
+						self.mover.moveToXY(x_step,y_step)
+					else:
+						self.mover.moveTo('x',x_step)
 					self.pos = self.mover.getPos()
 					self.meas = self.measurer.getMeasurement()
-					self.scannewdata.emit([self.counter,self.pos['x'],self.pos['y'],i,j,self.meas])
+					self.queue.append([self.counter,self.pos['x'],self.pos['y'],i,j,self.meas])
 					self.counter += 1
 					if self.abort == True:
 						self.scanaborted.emit()
@@ -1586,9 +2161,11 @@ class MoveDrone(QtCore.QObject):
 	def runMove(self):
 		self.init() #readies mover/measurer
 		#print self.mover.getPos()
-		if self.mMeas_par['xt']!=None:
+		if self.mMeas_par['xt']!=None and self.mMeas_par['yt']!=None:
+			self.mover.moveToXY(self.mMeas_par['xt'],self.mMeas_par['yt'])
+		elif self.mMeas_par['xt']!=None:
 			self.mover.moveTo('x',self.mMeas_par['xt'])
-		if self.mMeas_par['yt']!=None:
+		elif self.mMeas_par['yt']!=None:
 			self.mover.moveTo('y',self.mMeas_par['yt'])
 		#print self.mover.getPos()
 		self.mover.close()
@@ -1747,6 +2324,21 @@ class SettingsDialog(QtGui.QDialog):
 						't':'Attenuator 2 address:',
 						'w':QtGui.QLineEdit(),
 						'v':'att2addr'
+						},
+					'k':{
+						't':'Pipelined acquisition:',
+						'w':QtGui.QCheckBox(),
+						'v':'pipelined'
+						},
+					'l':{
+						't':'Rescue journal sync every (points):',
+						'w':QtGui.QSpinBox(),
+						'v':'journalsync'
+						},
+					'm':{
+						't':'Run fake instruments on a virtual clock:',
+						'w':QtGui.QCheckBox(),
+						'v':'virtualclock'
 						}
 					}
 				},
@@ -1804,6 +2396,11 @@ class SettingsDialog(QtGui.QDialog):
 						't':'Closed loop points',
 						'w':QtGui.QSpinBox(),
 						'v':'numpoints_m'
+						},
+					'k':{
+						't':'Serpentine:',
+						'w':QtGui.QCheckBox(),
+						'v':'serpentine_m'
 						}
 					}
 				},
@@ -1841,6 +2438,16 @@ class SettingsDialog(QtGui.QDialog):
 						't':'Y voltage step:',
 						'w':QtGui.QDoubleSpinBox(),
 						'v':'yvoltstep_s'
+						},
+					'q':{
+						't':'Serpentine:',
+						'w':QtGui.QCheckBox(),
+						'v':'serpentine_s'
+						},
+					'r':{
+						't':'Fly scan:',
+						'w':QtGui.QCheckBox(),
+						'v':'fly_s'
 						}
 					}
 				},
@@ -1860,14 +2467,74 @@ class SettingsDialog(QtGui.QDialog):
 						'v':'pausetime_c'
 						},
 					's':{
+						't':'Counter precision:',
+						'w':QtGui.QLineEdit(),
+						'v':'precision_c'
+						},
+					's1':{
+						't':'Counter gates:',
+						'w':QtGui.QLineEdit(),
+						'v':'gates_c'
+						},
+					't':{
 						't':'Reflection measurement time:',
 						'w':QtGui.QLineEdit(),
 						'v':'meastime_r'
 						},
-					't':{
+					'u':{
 						't':'Reflection pause time:',
 						'w':QtGui.QLineEdit(),
 						'v':'pausetime_r'
+						},
+					'u1':{
+						't':'Reflection samples:',
+						'w':QtGui.QLineEdit(),
+						'v':'samples_r'
+						},
+					'v':{
+						't':'Adaptive refinement:',
+						'w':QtGui.QCheckBox(),
+						'v':'adaptive_a'
+						},
+					'w':{
+						't':'Adaptive levels:',
+						'w':QtGui.QSpinBox(),
+						'v':'levels_a'
+						},
+					'x':{
+						't':'Adaptive threshold:',
+						'w':QtGui.QLineEdit(),
+						'v':'threshold_a'
+						},
+					'y':{
+						't':'Adaptive max points:',
+						'w':QtGui.QLineEdit(),
+						'v':'maxpoints_a'
+						},
+					'z':{
+						't':'Read both detectors:',
+						'w':QtGui.QCheckBox(),
+						'v':'bothdetectors'
+						},
+					'z1':{
+						't':'Z stack:',
+						'w':QtGui.QCheckBox(),
+						'v':'zstack_z'
+						},
+					'z2':{
+						't':'Z from:',
+						'w':QtGui.QLineEdit(),
+						'v':'zfrom_z'
+						},
+					'z3':{
+						't':'Z to:',
+						'w':QtGui.QLineEdit(),
+						'v':'zto_z'
+						},
+					'z4':{
+						't':'Z planes:',
+						'w':QtGui.QSpinBox(),
+						'v':'zplanes_z'
 						}
 					}
 				},
@@ -2039,9 +2706,10 @@ class SettingsDialog(QtGui.QDialog):
 						self.settings[self.tabtier['v']][self.childtier['v']] = None
 
 class MapperPlot(QtGui.QMainWindow):
-	def __init__(self,data,metadata,settings,filename):
+	def __init__(self,data,metadata,settings,filename,volume=None):
 		super(MapperPlot, self).__init__()
 		self.data = data
+		self.volume = volume
 		self.pm = metadata
 		self.settings = settings
 		self.se = settings['EXPORT']
@@ -2051,6 +2719,9 @@ class MapperPlot(QtGui.QMainWindow):
 			self.meas_par = self.pm['meas_par']
 		except KeyError:
 			self.meas_par = None
+		self.channels = []
+		if self.meas_par != None:
+			self.channels = channelsOf(self.meas_par)[:self.data.channels]
 		self.initUI()
 
 	def initUI(self):
@@ -2090,8 +2761,23 @@ class MapperPlot(QtGui.QMainWindow):
 		for unit in self.possible_units:
 			self.exp_units.addItem(unit)
 		self.possible_plots = ['Contour','Filled contour','Grid']
+		#z-stacks can also be shown a plane at a time, or focus-stacked
+		if self.volume != None:
+			self.possible_plots += ['Z slice','Best focus','Focus depth']
 		for plot in self.possible_plots:
 			self.plot_type.addItem(plot)
+		self.plane_select = QtGui.QSpinBox(self)
+		if self.volume != None:
+			self.planes = zPositions(self.meas_par)
+			self.plane_select.setRange(1,len(self.planes))
+			self.sharpest = sharpestPlane(self.volume.stack(0))
+			if self.sharpest != None:
+				self.plane_select.setValue(self.sharpest+1)
+				self.statusBar().showMessage('Sharpest plane: '+str(self.sharpest+1)+' (z = '+str(self.planes[self.sharpest])+')')
+		self.plane_select.setEnabled(False)
+		self.channel_select = QtGui.QComboBox(self)
+		self.channel_select.addItems([channel_names[channel] for channel in self.channels])
+		self.channel_select.setEnabled(len(self.channels) > 1)
 		self.show_datapoints = QtGui.QCheckBox('Show datapoints')
 
 		self.checkables = [ ['title',self.give_title],
@@ -2170,6 +2856,11 @@ class MapperPlot(QtGui.QMainWindow):
 
 		self.gridsection3.addWidget(QtGui.QLabel('Plot type:'),0,0)
 		self.gridsection3.addWidget(self.plot_type,0,1)
+		self.gridsection3.addWidget(QtGui.QLabel('Channel:'),1,0)
+		self.gridsection3.addWidget(self.channel_select,1,1)
+		if self.volume != None:
+			self.gridsection3.addWidget(QtGui.QLabel('Plane:'),2,0)
+			self.gridsection3.addWidget(self.plane_select,2,1)
 
 		self.sdp_widget = QtGui.QGroupBox('Contour settings')
 		self.sdp_widget.sdp_grid = QtGui.QGridLayout()
@@ -2179,7 +2870,7 @@ class MapperPlot(QtGui.QMainWindow):
 
 		self.panel_widget.vbox.addLayout(self.gridsection1)
 		self.panel_widget.vbox.addWidget(self.title_widget)
-		if self.meas_par != None and 'c' in self.meas_par['mtype']:
+		if self.meas_par != None and 'c' in self.channels:
 			if self.pm['wavelength'] != '' and self.pm['laserpower'] != 'Not measured' \
 				and self.pm['atten'] != '' and self.pm['dcr']!= '':
 				self.panel_widget.vbox.addWidget(self.convert_to_sde)
@@ -2188,7 +2879,7 @@ class MapperPlot(QtGui.QMainWindow):
 				self.convert_to_sde.setDisabled(True)
 				self.convert_to_sde.setChecked(False)
 				self.statusBar().showMessage('Unable to calculate SDE: insufficient data (power/attenuation/wavelength/dcr)')
-		elif self.meas_par != None and 'c' not in self.meas_par['mtype']:
+		elif self.meas_par != None and 'c' not in self.channels:
 			self.convert_to_sde.setDisabled(True)
 			self.convert_to_sde.setChecked(False)
 
@@ -2229,6 +2920,8 @@ class MapperPlot(QtGui.QMainWindow):
 
 		self.plot_type.activated.connect(self.updatePreview)
 		self.plot_type.activated.connect(self.plotTypeOptions)
+		self.channel_select.activated.connect(self.updatePreview)
+		self.plane_select.valueChanged.connect(self.updatePreview)
 		self.show_datapoints.toggled.connect(self.updatePreview)
 		self.convert_to_sde.toggled.connect(self.updatePreview)
 
@@ -2280,46 +2973,62 @@ class MapperPlot(QtGui.QMainWindow):
 			self.sdp_widget.setVisible(True)
 		else:
 			self.sdp_widget.setVisible(False)
+		self.plane_select.setEnabled(self.plot_type.currentText() == 'Z slice')
+
+	def volumeImage(self):
+		#(y_steps, x_steps) image from the z-stack, laid out as gridFromData's
+		self.stack = self.volume.stack(self.shown)
+		if self.plot_type.currentText() == 'Z slice':
+			self.image = np.array(self.stack[self.plane_select.value()-1])
+		else:
+			self.image, self.depth = bestFocus(self.stack)
+			if self.plot_type.currentText() == 'Focus depth':
+				return np.where(self.depth >= 0,np.array(self.planes)[self.depth],np.nan)
+		if self.sde:
+			self.image -= self.dc
+			self.image[self.image < 0] = 0.0
+			self.image *= self.scaling_factor
+		return self.image
 
 	def updatePreview(self):
 		if self.meas_par != None:
 			plt.figure('plotter')
-			self.data_array = np.array(self.data).transpose()
-			if self.checkSde() != False:
-				self.data_array[4] -= self.dc
-				for i, item in enumerate(self.data_array[4]):
-					if item < 0:
-						self.data_array[4][i] = 0.0
-				self.data_array[4] *= self.scaling_factor
+			self.x_data = self.data.column('x')
+			self.y_data = self.data.column('y')
+			self.shown = max(self.channel_select.currentIndex(),0)
+			self.z_values = self.data.channel(self.shown).copy()
+			#only counts can be turned into SDE
+			self.sde = self.channels[self.shown] == 'c' and self.checkSde() == True
+			if self.sde:
+				self.z_values -= self.dc
+				self.z_values[self.z_values < 0] = 0.0
+				self.z_values *= self.scaling_factor
 			#print 'current plot type:',self.plot_type.currentText()
 			if self.flip_colorbar.isChecked():
 				self.colorbar = ListedColormap(colormaps.viridis.colors[::-1])
 			else:
 				self.colorbar = colormaps.viridis
-			if self.plot_type.currentText() == 'Grid':
+			if self.plot_type.currentText() in ['Grid','Z slice','Best focus','Focus depth']:
 				self.fig.clear()
 				self.ax = self.fig.add_subplot(1,1,1)
-				self.extent = [self.data_array[0].min(), self.data_array[0].max(), self.data_array[1].min(),self.data_array[1].max()]
-				if self.pm['x_steps'] != None:
-					self.z_data = [list(self.data_array[4][x:x+self.pm['x_steps']]) for x in range(0,len(self.data_array[4]),self.pm['x_steps'])]
-					if len(self.z_data[-1]) < self.pm['x_steps']:
-						self.z_data[-1] += [np.nan]*(self.pm['x_steps'] - len(self.z_data[-1]))
-					self.extent[1] = max([self.data_array[0].max(),self.meas_par['xt'],self.meas_par['xf']])
-					self.extent[0] = min([self.data_array[0].min(),self.meas_par['xt'],self.meas_par['xf']])
-					if self.pm['y_steps'] != None and len(self.z_data) < self.pm['y_steps']:
-						self.z_data += [[np.nan]*self.pm['x_steps']]*(self.pm['y_steps']-len(self.z_data))
-						self.extent[3] = max([self.data_array[1].max(),self.meas_par['yt'],self.meas_par['yf']])
-						self.extent[2] = min([self.data_array[1].min(),self.meas_par['yt'],self.meas_par['yf']])
+				self.extent = [self.x_data.min(), self.x_data.max(), self.y_data.min(),self.y_data.max()]
+				if self.plot_type.currentText() == 'Grid':
+					self.z_data = gridFromData(self.data,self.pm['x_steps'],self.pm['y_steps'],adaptiveLevels(self.meas_par),self.z_values)
 				else:
-					self.z_data = [list(self.data_array[4])]
+					self.z_data = self.volumeImage()
+				if self.pm['x_steps'] != None:
+					self.extent[1] = max([self.x_data.max(),self.meas_par['xt'],self.meas_par['xf']])
+					self.extent[0] = min([self.x_data.min(),self.meas_par['xt'],self.meas_par['xf']])
+					if self.pm['y_steps'] != None:
+						self.extent[3] = max([self.y_data.max(),self.meas_par['yt'],self.meas_par['yf']])
+						self.extent[2] = min([self.y_data.min(),self.meas_par['yt'],self.meas_par['yf']])
 				if self.extent[2] == self.extent[3]:
 					self.extent[3] += 0.000001
 				if self.extent[0] == self.extent[1]:
 					self.extent[1] += 0.000001
 				#correct for swapped .extents()
 				if not self.pm['x_forward']:
-					for r, row in enumerate(self.z_data):
-						self.z_data[r] = row[::-1]
+					self.z_data = self.z_data[:,::-1]
 				if self.pm['y_forward']:
 					self.z_data = self.z_data[::-1]
 
@@ -2335,7 +3044,7 @@ class MapperPlot(QtGui.QMainWindow):
 				elif self.plot_type.currentText() == 'Filled contour':
 					self.plotwith = plt.tricontourf
 				try:
-					self.contourf = self.plotwith(self.data_array[0],self.data_array[1],self.data_array[4],cmap=self.colorbar)
+					self.contourf = self.plotwith(self.x_data,self.y_data,self.z_values,cmap=self.colorbar)
 				except RuntimeError:
 					pass
 				except ValueError:
@@ -2349,17 +3058,19 @@ class MapperPlot(QtGui.QMainWindow):
 				self.start_time = time.time()
 				if self.show_datapoints.isChecked():
 					self.colordata = []
-					for value in [((x-min(self.data_array[4]))/(max(self.data_array[4]-min(self.data_array[4])))) for x in self.data_array[4]]:
+					for value in (self.z_values-self.z_values.min())/(self.z_values-self.z_values.min()).max():
 						self.colordata.append(self.colorbar(value))
 					#print 'finished doing colordata at:',time.time()-self.start_time
-					for v, value in enumerate(self.data_array[0]):
-						self.plot = plt.plot([self.data_array[0][v]], [self.data_array[1][v]],'o',color=self.colordata[v],ms=10)
+					for v, value in enumerate(self.x_data):
+						self.plot = plt.plot([self.x_data[v]], [self.y_data[v]],'o',color=self.colordata[v],ms=10)
 					#print 'finished plotting at:',time.time()-self.start_time
-			if self.checkSde() == True:
+			if self.plot_type.currentText() == 'Focus depth':
+				self.cbar.set_label('Sharpest Z')
+			elif self.sde:
 				self.cbar.set_label('SDE (%)')
-			elif 'c' in self.meas_par['mtype'] and self.checkSde() != True:
+			elif self.channels[self.shown] == 'c':
 				self.cbar.set_label('Counts ($s^{-1}$)')
-			elif 'r' in self.meas_par['mtype']:
+			elif self.channels[self.shown] == 'r':
 				self.cbar.set_label('Reflection (arbitrary)')
 
 		self.updateCanvasSize()
@@ -2440,7 +3151,10 @@ class MapperPlot(QtGui.QMainWindow):
 						self.textstr += str(key)+': '+str(self.pm[key])+'\n'
 					elif self.meas_par != None:
 						for key2 in sorted(self.pm['meas_par'].keys()):
-							if key2 in ['measurer','mover']:
+							if key2 == 'measurers':
+								self.textstr += str(key2)+': '+', '.join(device['__class__'] if type(device) == dict else deviceName(device)
+																		for device in self.pm[key][key2])+'\n'
+							elif key2 in ['measurer','mover']:
 								if type(self.pm[key][key2])!=dict:
 									self.textstr += str(key2)+': '+str(self.pm[key][key2].__class__.__name__)+'\n'
 								else:
@@ -2506,15 +3220,17 @@ class MapperPlot(QtGui.QMainWindow):
 				plt.savefig(self.filename,dpi=float(self.dpi.text()))
 			else:
 				with open(self.filename,'w') as f:
-					self.data_for_export = self.data
-					if self.checkSde() != False:
+					self.data_for_export = self.data.tolist()
+					if 'c' in self.channels and self.checkSde() != False:
+						#the counts column, whichever channel it is
+						self.sde_column = 4+self.channels.index('c')
 						for r, row in enumerate(self.data_for_export):
-							self.data_for_export[r][4] -= self.dc
-							if self.data_for_export[r][4] < 0:
-								self.data_for_export[r][4] == 0.0
-							self.data_for_export[r][4] *= self.scaling_factor
+							self.data_for_export[r][self.sde_column] -= self.dc
+							if self.data_for_export[r][self.sde_column] < 0:
+								self.data_for_export[r][self.sde_column] = 0.0
+							self.data_for_export[r][self.sde_column] *= self.scaling_factor
 					self.csvfile = csv.writer(f,delimiter = ',')
-					self.csvfile.writerows(list(np.array(self.data)))
+					self.csvfile.writerows(self.data_for_export)
 			self.statusBar().showMessage('Graph data saved to: '+str(self.filename))
 
 	def resetPlot(self):
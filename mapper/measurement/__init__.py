@@ -4,8 +4,17 @@
 
 import time
 import random
+import numpy as np
 import visa
 
+from simclock import clock as simulated
+try:
+	from attolib import LockIn as CurveBuffer
+except ImportError as e:
+	print 'attolib failed to load'
+	CurveBuffer = None
+	attolib_error = str(e)
+
 timeout = 5000
 
 def findClass(key=None):
@@ -13,6 +22,7 @@ def findClass(key=None):
 			'fakecounter':FakeCounter,
 			'fakereflec':FakeLockIn,
 			'universalcounter':UniversalCounter,
+			'counter53220':Counter53220,
 			'lockin':LockIn,
 			 }
 	if key == None:
@@ -22,12 +32,62 @@ def findClass(key=None):
 class Measurer:
 	#superclass; features are vital for any controller implemented
 	#be it counter or power meter or otherwise
+	moved_at = None
+	precision = None
+	dwell = None
+	clock = time #what waits are timed with; the fakes use the simulation clock
+	gateClosed = None #called by closeGate, set by the pipelined map
 	def __init__(self):
 		pass
 
 	def setDefaults(self):
 		print 'Not implemented: initialise'
 
+	def setMoveTime(self,moved_at):
+		'''
+		tells the measurer when the last move finished
+		'''
+		self.moved_at = moved_at
+
+	def settle(self):
+		'''
+		waits until pausetime has passed since the last move finished;
+		time already spent since then (eg reading position) counts towards it
+		'''
+		if self.moved_at == None:
+			self.clock.sleep(self.pausetime)
+		else:
+			self.wait = self.pausetime - (time.time() - self.moved_at)
+			if self.wait > 0:
+				self.clock.sleep(self.wait)
+
+	def countAdaptively(self,readGate):
+		'''
+		sums the counts of readGate() (one subgate each) until their Poisson
+		relative uncertainty 1/sqrt(N) is within precision or meastime is
+		used up; returns the rate, leaving the time counted in self.dwell
+		'''
+		self.counts = 0.0
+		self.gates = 0
+		self.max_gates = max(1,int(round(self.meastime/self.subgate)))
+		while self.gates < self.max_gates:
+			self.counts += readGate()
+			self.gates += 1
+			if self.counts > 0 and self.counts >= self.precision**-2:
+				break
+		self.dwell = self.gates*self.subgate
+		return self.counts/self.dwell
+
+	def closeGate(self):
+		'''
+		says the detector has stopped taking in signal for this reading,
+		so the stage may move while the value is still being transferred
+		and parsed; drivers that cannot tell are taken to close the gate
+		when getMeasurement returns
+		'''
+		if self.gateClosed != None:
+			self.gateClosed()
+
 	def getMeasurement(self):
 		print 'Not implemented: getMeasurement'
 
@@ -35,9 +95,17 @@ class Measurer:
 		print 'Not implemented: close'
 	
 class UniversalCounter(Measurer):
+	'''
+	53131A counter; several gates are averaged by its statistics on one
+	trigger (CALC3:AVER, TRIG:COUN:AUTO) and only their mean is read back,
+	for averaging and for counting to a precision in blocks
+	'''
 	devicetype = 'c'
 	tests = {'c':  [[['tp','tm'],[0,2],'Time(s) out of bounds']]}
+	subgate = 0.05
+	averaging = 1
 	def __init__(self,address='GPIB0::3'):
+		self.address = address
 		try:
 			self.rm = visa.ResourceManager()
 			self.device = self.rm.open_resource(address)
@@ -51,22 +119,160 @@ class UniversalCounter(Measurer):
 	def setDefaults(self,meastime,pausetime):
 		self.meastime = float(meastime)
 		self.pausetime = float(pausetime)
+		self.precision = None
+		self.dwell = None
+		self.averaging = 1
 		self.device.write('SENS:TOT:ARM:STOP:TIM '+str(self.meastime))
+		self.device.write(':CALC3:AVER OFF;:TRIG:COUN:AUTO OFF')
+		self.gatetime = self.meastime
+		self.statistics = 1
+
+	def configure(self,gatetime,gates=1):
+		'''
+		sets the gate time and the number of gates the statistics average
+		over on one trigger, sending only what has changed
+		'''
+		if gatetime != self.gatetime:
+			self.device.write('SENS:TOT:ARM:STOP:TIM '+str(gatetime))
+			self.gatetime = gatetime
+		if gates != self.statistics:
+			if gates > 1:
+				self.device.write(':CALC3:AVER:TYPE MEAN;:CALC3:AVER:COUN '+str(int(gates))+';:CALC3:AVER ON;:TRIG:COUN:AUTO ON')
+			else:
+				self.device.write(':CALC3:AVER OFF;:TRIG:COUN:AUTO OFF')
+			self.statistics = gates
+
+	def setPrecision(self,precision):
+		'''
+		counts in subgates until the rate is known to precision (relative),
+		with meastime as the longest dwell
+		'''
+		self.precision = float(precision)
+		self.configure(self.subgate)
+
+	def setAveraging(self,gates):
+		'''
+		splits meastime into gates gates, taken on one trigger and read
+		back together; getMeasurement returns their mean rate
+		'''
+		self.averaging = int(gates)
+
+	def blockCounts(self,gates,gatetime):
+		'''
+		total counts of gates gates of gatetime, taken on one trigger and
+		read back as their mean in one transfer rather than a READ? each
+		'''
+		self.configure(gatetime,gates)
+		if gates == 1:
+			return float(self.device.query('READ?'))
+		self.device.write(':INIT')
+		#*WAI holds the query until the last gate, so the timeout has to cover them all
+		self.device.timeout = timeout+int(1000*gates*gatetime)
+		try:
+			self.mean = float(self.device.query('*WAI;:CALC3:DATA?'))
+		finally:
+			self.device.timeout = timeout
+		return self.mean*gates
+
+	def countInBlocks(self):
+		'''
+		countAdaptively with subgates taken in blocks, each sized from the
+		rate so far to the gates still needed (doubling while nothing has
+		been counted); every gate taken counts towards the rate and
+		self.dwell, so the last block may run a little past the precision
+		'''
+		self.counts = 0.0
+		self.gates = 0
+		self.max_gates = max(1,int(round(self.meastime/self.subgate)))
+		self.target = self.precision**-2
+		while self.gates < self.max_gates:
+			if self.counts > 0:
+				self.block_size = int(np.ceil((self.target-self.counts)*self.gates/self.counts))
+			else:
+				self.block_size = max(self.gates,1)
+			self.block_size = min(max(self.block_size,1),self.max_gates-self.gates)
+			self.counts += self.blockCounts(self.block_size,self.subgate)
+			self.gates += self.block_size
+			if self.counts > 0 and self.counts >= self.target:
+				break
+		self.dwell = self.gates*self.subgate
+		return self.counts/self.dwell
 
 	def getMeasurement(self):
-		time.sleep(self.pausetime)
+		self.settle()
+		if self.precision != None:
+			return self.countInBlocks()
+		if self.averaging > 1:
+			return self.blockCounts(self.averaging,self.meastime/self.averaging)/self.meastime
+		self.configure(self.meastime)
 		return (float(self.device.query('READ?'))/float(self.meastime))
 
 	def close(self):
 		self.device.close()
 
+class Counter53220(UniversalCounter):
+	'''
+	53220A counter; its reading memory keeps every gate taken on one
+	trigger (SAMP:COUN, INIT) and they are fetched in one transfer (FETC?)
+	'''
+	def setDefaults(self,meastime,pausetime):
+		self.meastime = float(meastime)
+		self.pausetime = float(pausetime)
+		self.precision = None
+		self.dwell = None
+		self.averaging = 1
+		#totalize over a timed gate, one reading per trigger
+		self.device.write('CONF:TOT:TIM '+str(self.meastime))
+		self.gatetime = self.meastime
+		self.samples = 1
+
+	def configure(self,gatetime,samples=1):
+		'''
+		sets the gate time and the number of readings each trigger takes,
+		sending only what has changed
+		'''
+		if gatetime != self.gatetime:
+			self.device.write('SENS:TOT:GATE:TIME '+str(gatetime))
+			self.gatetime = gatetime
+		if samples != self.samples:
+			self.device.write('SAMP:COUN '+str(int(samples)))
+			self.samples = samples
+
+	def getReadings(self,readings,gatetime=None):
+		'''
+		rates (counts per second) of readings gates of gatetime (meastime
+		if None), stored in the counter's reading memory and fetched in one
+		transfer rather than a READ? each
+		'''
+		if gatetime == None:
+			gatetime = self.meastime
+		self.configure(gatetime,readings)
+		self.device.write('INIT')
+		#FETC? waits for the last gate, so the timeout has to cover them all
+		self.device.timeout = timeout+int(1000*readings*gatetime)
+		try:
+			self.block = self.device.query('FETC?')
+		finally:
+			self.device.timeout = timeout
+		return np.array(self.block.strip().split(','),dtype=float)/gatetime
+
+	def blockCounts(self,gates,gatetime):
+		return self.getReadings(gates,gatetime).sum()*gatetime
+
 class LockIn(Measurer):
 	devicetype = 'r'
 	tests = {'r':  [[['tp','tm'],[0,2],'Time(s) out of bounds']]}
+	curve_interval = 0.005 #curve buffer storage interval resolution (s)
+	averaging = 1
 	def __init__(self,address='GPIB0::16'):
+		self.address = address
+		if CurveBuffer == None:
+			self.device = 'attolib failed to load: '+attolib_error
+			return
 		try:
-			self.rm = visa.ResourceManager()
-			self.device = self.rm.open_resource(address,read_termination = '\r\n')
+			#attolib's lock-in, for its curve buffer calls
+			self.lockin = CurveBuffer(address)
+			self.device = self.lockin.instrument
 			self.device.timeout = timeout
 		except visa.VisaIOError as e:
 			self.device = str(e)
@@ -74,10 +280,45 @@ class LockIn(Measurer):
 			self.device = str(e)
 
 	def setDefaults(self,meastime,pausetime):
+		self.meastime = float(meastime)
 		self.pausetime = float(pausetime)
+		self.averaging = 1
+
+	def setAveraging(self,samples):
+		'''
+		averages samples readings of ADC1 spread over meastime, stored in
+		the curve buffer and read back together; getMeasurement returns
+		their mean and leaves them (and their times) in self.values and
+		self.timestamps
+		'''
+		self.averaging = int(samples)
+
+	def getReadings(self,readings,interval=None):
+		'''
+		readings values of ADC1 stored in the curve buffer every interval
+		(meastime if None, rounded to the 5 ms the buffer keeps time in)
+		and read back in one transfer; the time each was taken is left in
+		self.timestamps
+		'''
+		if interval == None:
+			interval = self.meastime
+		self.interval = max(round(interval/self.curve_interval),1)*self.curve_interval
+		started = self.lockin.start_curve(self.interval,readings)
+		self.timestamps = started+self.interval*np.arange(readings)
+		#the buffer fills at its own pace, so it is only asked how far it is
+		#once it should be done
+		time.sleep(readings*self.interval)
+		deadline = time.time()+1
+		while self.lockin.curve_points() < readings and time.time() < deadline:
+			time.sleep(self.interval)
+		self.closeGate()
+		return np.array(self.lockin.read_curve(readings))
 
 	def getMeasurement(self):
-		time.sleep(self.pausetime)
+		self.settle()
+		if self.averaging > 1:
+			self.values = self.getReadings(self.averaging,self.meastime/self.averaging)
+			return self.values.mean()
 		return float(self.device.query('ADC. 1'))
 
 	def close(self):
@@ -86,24 +327,84 @@ class LockIn(Measurer):
 class FakeLockIn(Measurer):
 	tests = {'r':  [[['tp','tm'],[0,2],'Time(s) out of bounds']]}
 	devicetype = 'r'
+	clock = simulated
+	level = -0.8 #mean reading
+	noise = 0.1 #its standard deviation
+	latency = 0.0 #bus round trip per reading (s)
+	curve_interval = 0.005
+	averaging = 1
 	def setDefaults(self,meastime,pausetime):
 		self.meastime = meastime
 		self.pausetime = pausetime
+		self.averaging = 1
+
+	def setAveraging(self,samples):
+		self.averaging = int(samples)
+
+	def getReadings(self,readings,interval=None):
+		if interval == None:
+			interval = self.meastime
+		self.interval = max(round(interval/self.curve_interval),1)*self.curve_interval
+		self.timestamps = self.clock.time()+self.interval*np.arange(readings)
+		self.clock.sleep(readings*self.interval)
+		self.closeGate()
+		self.clock.sleep(self.latency)
+		return np.random.normal(self.level,self.noise,int(readings))
 
 	def getMeasurement(self):
-		time.sleep(self.pausetime)
-		time.sleep(self.meastime)
-		return random.gauss(-0.8,0.1)
+		self.settle()
+		if self.averaging > 1:
+			self.values = self.getReadings(self.averaging,self.meastime/self.averaging)
+			return self.values.mean()
+		self.clock.sleep(self.meastime)
+		self.closeGate()
+		self.clock.sleep(self.latency)
+		return random.gauss(self.level,self.noise)
 
 
 class FakeCounter(Measurer):
 	devicetype = 'c'
 	tests = {'c':  [[['tp','tm'],[0,2],'Time(s) out of bounds']]}
+	subgate = 0.01
+	clock = simulated
+	mean_rate = 3000 #counts per second
+	rate_noise = 250 #point-to-point standard deviation of the rate
+	latency = 0.0 #bus round trip per gate (s)
 	def setDefaults(self,meastime,pausetime):
 		self.meastime = meastime
 		self.pausetime = pausetime
+		self.precision = None
+		self.dwell = None
+		self.averaging = 1
+
+	def setPrecision(self,precision):
+		self.precision = float(precision)
+
+	def setAveraging(self,gates):
+		self.averaging = int(gates)
+
+	def getReadings(self,readings,gatetime=None):
+		if gatetime == None:
+			gatetime = self.meastime
+		self.clock.sleep(readings*gatetime)
+		self.closeGate()
+		self.clock.sleep(self.latency)
+		self.rate = max(random.gauss(self.mean_rate,self.rate_noise),0)
+		return np.random.poisson(self.rate*gatetime,readings)/float(gatetime)
 
 	def getMeasurement(self):
-		time.sleep(self.pausetime)
-		time.sleep(self.meastime)
-		return random.gauss(3000,250)
\ No newline at end of file
+		self.settle()
+		if self.averaging > 1:
+			self.rates = self.getReadings(self.averaging,self.meastime/self.averaging)
+			return self.rates.mean()
+		if self.precision == None:
+			self.clock.sleep(self.meastime)
+			self.closeGate()
+			self.clock.sleep(self.latency)
+			return random.gauss(self.mean_rate,self.rate_noise)
+		self.rate = max(random.gauss(self.mean_rate,self.rate_noise),0)
+		return self.countAdaptively(self.fakeGate)
+
+	def fakeGate(self):
+		self.clock.sleep(self.subgate+self.latency)
+		return np.random.poisson(self.rate*self.subgate)
\ No newline at end of file
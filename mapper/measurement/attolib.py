@@ -14,6 +14,8 @@
 import visa
 import time
 import math
+import collections
+import threading
 import numpy as np
 
 # Desirable features:
@@ -35,12 +37,18 @@ class Stages:
         aidmap = {'x':3, 'y':2, 'z':1}
         '''
         self.aidmap = {'x':3, 'y':2, 'z':1} #axis ID map
+        self.state = {} #mode, voltage and frequency last set, per axis
+        self.stream = '' #received, not yet parsed
+        self.pending = collections.deque() #commands sent, response not yet read
+        self.ok = True
         print 'initialising device on',Stages_port
         self.rm = visa.ResourceManager()
         self.instrument = self.rm.open_resource(Stages_port, baud_rate = 38400)
         #self.instrument = visa.SerialInstrument(Stages_port, baud_rate = 38400, data_bits = 8, stop_bits = 1, parity = visa.no_parity)
         self.instrument.query_delay = 0.2
-        self.instrument.write('echo on')
+        #responses are told apart by order and OK/ERROR, so echoing each
+        #command back would only double the traffic
+        self.instrument.write('echo off')
         self.empty_buffer()
         self.get_capacitances()
         for key, value in kwargs.iteritems():
@@ -70,7 +78,9 @@ class Stages:
                 self.rawread()
             except visa.VisaIOError:
                 break
-    
+        self.stream = ''
+        self.pending.clear()
+
     def write(self,command):
         '''
         args: command
@@ -88,25 +98,84 @@ class Stages:
         '''
         return self.instrument.read()
 
+    def fill(self):
+        '''
+        adds what has arrived on the serial line to the stream, waiting
+        (up to the timeout) for at least one byte
+        '''
+        self.stream += self.instrument.read_bytes(max(self.instrument.bytes_in_buffer,1))
+
+    def readline(self):
+        '''
+        next line of the stream, without line end or prompt
+        '''
+        while '\n' not in self.stream:
+            self.fill()
+        self.line, self.stream = self.stream.split('\n',1)
+        return self.line.strip().strip('>').strip()
+
     def read(self):
+        '''
+        response lines to the oldest command in flight, up to the OK or
+        ERROR the controller ends every response with; self.ok says which
+        (an error, or a timeout, also forgets the cached axis state)
+        '''
+        self.command = self.pending.popleft()
         self.readbuffer = []
-        while True:
-            self.readbuffer.append(self.rawread().strip('\n').strip('>').strip())
-            if self.readbuffer[-1] == 'OK':
-                break
-        return self.readbuffer
+        try:
+            while len(self.readbuffer) == 0 or self.readbuffer[-1] not in ['OK','ERROR']:
+                self.line = self.readline()
+                if self.line != '':
+                    self.readbuffer.append(self.line)
+        except visa.VisaIOError:
+            #whatever else was in flight is lost with it
+            self.pending.clear()
+            self.stream = ''
+            self.ok = False
+            self.forget()
+            raise
+        self.ok = self.readbuffer[-1] == 'OK'
+        if not self.ok:
+            print 'Error from '+self.command+': '+' '.join(self.readbuffer[:-1])
+            self.forget()
+        return self.readbuffer[:-1]
+
+    def send(self,command):
+        '''
+        writes command without waiting; read() picks up its response in
+        turn
+        '''
+        self.write(command)
+        self.pending.append(command)
 
     def query(self,command):
         '''
         writes command; returns read() result
+        responses still due for commands sent before are read first (and
+        dropped)
         '''
-        self.write(command)
-        self.output = self.read()
-        if self.output[0] != command:
-            print 'Potentially malformed output; asked for '+str(command)+' but received '+str(self.output[0])
-        if self.output[-1] != 'OK':
-            print 'Output not OK'
-        return self.output[1:-1]
+        self.send(command)
+        while len(self.pending) > 1:
+            self.read()
+        return self.read()
+
+    def pipeline(self,commands):
+        '''
+        args: list of commands
+        sends them all before reading any response, then reads the
+        responses in order; returns them, with self.ok only if all were OK
+        '''
+        while len(self.pending) > 0:
+            self.read()
+        for command in commands:
+            self.send(command)
+        self.responses = []
+        self.all_ok = True
+        for command in commands:
+            self.responses.append(self.read())
+            self.all_ok = self.all_ok and self.ok
+        self.ok = self.all_ok
+        return self.responses
 
     def lazyask(self,command):
         '''
@@ -122,19 +191,63 @@ class Stages:
         if self.result != []:
             print self.result,'was unexpectedly returned from tell()'
 
+    def forget(self, axes = 'xyz'):
+        '''
+        optional arg: aidmap'able axes in string
+        drops what is cached about the axes, so it is asked or set afresh
+        '''
+        for axis in axes:
+            self.state.pop(axis,None)
+
+    def cached(self,axis,key):
+        '''
+        last value of key ('mode', 'voltage' or 'frequency') set on axis,
+        None if not known
+        '''
+        return self.state.get(axis,{}).get(key)
+
+    def remember(self,axis,key,value):
+        '''
+        caches value as key of axis, if the command setting it went through
+        '''
+        if self.ok:
+            self.state.setdefault(axis,{})[key] = value
+
     def set_voltage(self,axis,voltage):
         '''
         args: aidmap'able axis, voltage (V)
-        will auto-cap at limit level
+        will auto-cap at limit level; not sent if already set
         '''
+        if self.cached(axis,'voltage') == voltage:
+            return
         self.tell('setv '+str(self.aidmap[axis])+' '+str(voltage))
+        self.remember(axis,'voltage',voltage)
+
+    def set_drive(self,axis,voltage,frequency):
+        '''
+        args: aidmap'able axis, voltage (V), freq (Hz)
+        set_voltage and set_frequency with both commands in flight at once
+        '''
+        self.commands = []
+        if self.cached(axis,'voltage') != voltage:
+            self.commands.append('setv '+str(self.aidmap[axis])+' '+str(voltage))
+        if self.cached(axis,'frequency') != frequency:
+            self.commands.append('setf '+str(self.aidmap[axis])+' '+str(frequency))
+        if self.commands == []:
+            return
+        self.pipeline(self.commands)
+        self.remember(axis,'voltage',voltage)
+        self.remember(axis,'frequency',frequency)
 
     def set_frequency(self,axis,frequency):
         '''
         args: aidmap'able axis, freq (Hz)
-        will auto-cap at limit level
+        will auto-cap at limit level; not sent if already set
         '''
+        if self.cached(axis,'frequency') == frequency:
+            return
         self.tell('setf '+str(self.aidmap[axis])+' '+str(frequency))
+        self.remember(axis,'frequency',frequency)
 
     def get_capacitances(self):
         '''
@@ -143,6 +256,7 @@ class Stages:
         print 'Capacitances:'
         for self.key in sorted(self.aidmap.keys()):
             self.query('setm '+str(self.aidmap[self.key])+' cap')
+            self.remember(self.key,'mode','cap')
             self.query('capw '+str(self.aidmap[self.key]))
             print self.key + ':',self.query('getc '+str(self.aidmap[self.key]))[0].split('= ')[1]
         
@@ -155,35 +269,54 @@ class Stages:
             if axis in axes:
                 self.axes.append(axis)
         for axis in self.axes:
+            self.forget(axis)
             self.query('setm '+str(self.aidmap[axis])+' gnd')
+            self.remember(axis,'mode','gnd')
 
     def set_step(self,axis):
         '''
-        sets system to step mode
+        sets system to step mode; the mode is only asked for if not known
         '''
-        if self.lazyask('getm '+str(self.aidmap[axis])) != 'mode = stp':
+        if self.cached(axis,'mode') == None:
+            self.remember(axis,'mode',self.lazyask('getm '+str(self.aidmap[axis])).split('= ')[-1])
+        if self.cached(axis,'mode') != 'stp':
             self.tell('setm '+str(self.aidmap[axis])+' stp')
+            self.remember(axis,'mode','stp')
+
+    def step(self,bursts):
+        '''
+        arg: dict of aidmap'able axis: steps (negative steps down)
+        starts every burst before waiting for any, so the axes step at
+        the same time; returns when all are done
+        '''
+        for axis in bursts:
+            self.set_step(axis)
+        self.commands = []
+        for axis, steps in bursts.items():
+            if steps >= 0:
+                self.commands.append('stepu '+str(self.aidmap[axis])+' '+str(steps))
+            else:
+                self.commands.append('stepd '+str(self.aidmap[axis])+' '+str(-steps))
+        self.pipeline(self.commands+['stepw '+str(self.aidmap[axis]) for axis in bursts])
 
     def stepu(self,axis,steps):
         '''
         steps up
         '''
-        self.set_step(axis)
-        self.tell('stepu '+str(self.aidmap[axis])+' '+str(steps))
-        self.tell('stepw '+str(self.aidmap[axis]))
+        self.step({axis:steps})
 
     def stepd(self,axis,steps):
         '''
         steps down
         '''
-        self.set_step(axis)
-        self.tell('stepd '+str(self.aidmap[axis])+' '+str(steps))
-        self.tell('stepw '+str(self.aidmap[axis]))
+        self.step({axis:-steps})
 
 class Readout:
     '''
     A class to encapsulate communication with the ARC200 readout
     '''
+    history = 256 #samples kept while streaming
+
     def __init__(self,Read_port,**kwargs):
         '''
         initialises Readout
@@ -193,6 +326,9 @@ class Readout:
         '''
         print 'initialising device on',Read_port
         self.aidmap = {'x':1, 'y':2, 'z':3} #axis ID map
+        self.streaming = False
+        self.samples = collections.deque(maxlen=self.history) #(time, positions), newest last
+        self.arrived = threading.Condition()
         self.rm = visa.ResourceManager()
         self.instrument = self.rm.open_resource(Read_port, baud_rate = 57600, data_bits = 8, stop_bits=visa.constants.StopBits.one, read_termination='', write_termination='')
         #self.instrument = visa.SerialInstrument( term_chars="")
@@ -219,12 +355,81 @@ class Readout:
             except:# visa.VisaIOError:
                 break
 
-    def position(self,axis=False):
+    def start_stream(self):
+        '''
+        switches to continuous output, read into samples on a thread of its
+        own, so position() answers from the latest sample without asking
+        '''
+        if self.streaming:
+            return
+        self.set_continuous()
+        self.samples.clear()
+        self.streaming = True
+        self.reader_thread = threading.Thread(target=self.reader)
+        self.reader_thread.daemon = True
+        self.reader_thread.start()
+
+    def stop_stream(self):
+        '''
+        back to single shot, asked for each position
+        '''
+        if not self.streaming:
+            return
+        self.streaming = False
+        self.reader_thread.join()
+        self.set_single_shot()
+        self.empty_buffer()
+
+    def reader(self):
+        '''
+        runs while streaming: parses each line of the continuous output,
+        stamped with the time it arrived, into samples
+        '''
+        stream = ''
+        while self.streaming:
+            try:
+                stream += self.instrument.read_bytes(max(self.instrument.bytes_in_buffer,1))
+            except visa.VisaIOError:
+                continue
+            lines = stream.replace('\r','\n').split('\n')
+            stream = lines.pop()
+            for line in lines:
+                try:
+                    values = [float(i) for i in line.split(',')]
+                    positions = {key:values[self.aidmap[key]-1] for key in self.aidmap.keys()}
+                except (ValueError, IndexError):
+                    continue
+                with self.arrived:
+                    self.samples.append((time.time(),positions))
+                    self.arrived.notify_all()
+
+    def latest(self,since=None,timeout=1.0):
+        '''
+        (time, positions) of the newest sample while streaming, waiting up
+        to timeout for one that arrived after since (a time.time()), or for
+        any if None; IOError if none comes
+        '''
+        deadline = time.time()+timeout
+        with self.arrived:
+            while len(self.samples) == 0 or (since != None and self.samples[-1][0] <= since):
+                if time.time() >= deadline:
+                    raise IOError('no new position from the ARC200 in '+str(timeout)+' s')
+                self.arrived.wait(deadline-time.time())
+            return self.samples[-1]
+
+    def position(self,axis=False,since=None):
         '''
         reads positions to dict of floats; takes optional axis argument to return just one value
+        and optional since (a time.time()) to only accept a reading taken after it
+        while streaming this is the latest sample, with no query sent
         '''
-        self.positionstring = [float(i) for i in self.query('C').split(',')]
-        self.positions = {key:self.positionstring[self.aidmap[key]-1] for key in self.aidmap.keys()}
+        if self.streaming:
+            self.positions = dict(self.latest(since)[1])
+        else:
+            if since != None and since > time.time():
+                time.sleep(since-time.time())
+            self.positionstring = [float(i) for i in self.query('C').split(',')]
+            self.positions = {key:self.positionstring[self.aidmap[key]-1] for key in self.aidmap.keys()}
         if axis==False or axis not in self.aidmap:
             return self.positions
         else:
@@ -254,6 +459,9 @@ class Readout:
         '''
         closes gracefully
         '''
+        if self.streaming:
+            self.streaming = False
+            self.reader_thread.join()
         self.set_continuous()
         self.instrument.close()
 
@@ -261,6 +469,9 @@ class LockIn:
     '''
     smart object that allows smart movement
     '''
+    ramp_rate = 100.0 #fastest the DACs are slewed (V/s)
+    ramp_step = 1.0 #largest change in one write (V)
+
     def __init__(self,LockIn_port):
         self.rm = visa.ResourceManager()
         self.instrument = self.rm.open_resource(LockIn_port, read_termination = '\r\n')
@@ -282,20 +493,72 @@ class LockIn:
         try:
             self.write('DAC. '+str(self.aidmap[axis])+" %.3f" % (value))
         except KeyError as e:
-            print 'Unrecognised key! {0}: {1}'.format(e.errno, e.strerror)
-        
-    def move(self,axis,value):
+            print 'Unrecognised key!',e
+
+    def dac(self,axis):
+        '''
+        value of the DAC for axis, read back from the lock-in (it can be
+        set from the front panel or another program between moves)
+        '''
+        return float(self.query('DAC. '+str(self.aidmap[axis])))
+
+    def ramp(self,targets):
+        '''
+        ramps the DACs to targets ({axis: value}) side by side, in writes
+        of at most ramp_step and no faster than ramp_rate; each write goes
+        out on a schedule kept from the start of the ramp (the time a write
+        takes comes out of the wait, not on top of it), and nothing is
+        waited after the last write
+        '''
         try:
-            self.current_position = float(self.query('DAC. '+str(self.aidmap[axis])))
-            if abs(value - self.current_position)<=1.0:
-                self.write('DAC. '+str(self.aidmap[axis])+" %.3f" % (value))
-            else:
-                self.steps = np.linspace(self.current_position, value, math.ceil(abs(value-self.current_position))+1)[1:]
-                for step in self.steps:
-                    self.write('DAC. '+str(self.aidmap[axis])+" %.3f" % (step))
-                    time.sleep(0.05)
+            self.starts = dict((axis,self.dac(axis)) for axis in targets)
+            self.span = max(abs(targets[axis]-self.starts[axis]) for axis in targets)
+            self.nsteps = max(int(math.ceil(self.span/self.ramp_step)),1)
+            self.ramps = dict((axis,np.linspace(self.starts[axis],targets[axis],self.nsteps+1)[1:]) for axis in targets)
+            self.interval = self.span/self.nsteps/self.ramp_rate
+            self.t0 = time.time()
+            for n in range(self.nsteps):
+                self.delay = self.t0 + n*self.interval - time.time()
+                if self.delay > 0:
+                    time.sleep(self.delay)
+                for axis in targets:
+                    self.write('DAC. '+str(self.aidmap[axis])+" %.3f" % (self.ramps[axis][n]))
         except KeyError as e:
-            print 'Unrecognised key! {0}: {1}'.format(e.errno, e.strerror)
+            print 'Unrecognised key!',e
+
+    def move(self,axis,value):
+        self.ramp({axis:value})
+
+    def start_curve(self,interval,length):
+        '''
+        clears the curve buffer and starts storing ADC1 into it every
+        interval seconds (a multiple of 5 ms) for length points; returns
+        the time storing began
+        the setup is sent every time, as other objects may drive the same
+        lock-in's buffer in between
+        '''
+        self.write('NC')
+        self.write('CBD 32')
+        self.write('LEN '+str(int(length)))
+        self.write('STR '+str(int(round(interval*1000))))
+        self.write('TD')
+        return time.time()
+
+    def curve_points(self):
+        '''
+        number of points stored in the curve buffer so far
+        '''
+        return int(self.query('M').split(',')[3])
+
+    def read_curve(self,points):
+        '''
+        ADC1 values from the curve buffer, read back in one go
+        '''
+        self.write('DC. 5')
+        self.raw = ''
+        while len(self.raw.split()) < points:
+            self.raw += self.instrument.read_raw()
+        return [float(value) for value in self.raw.split()[:points]]
 
     def close(self):
         self.instrument.close()
@@ -305,9 +568,14 @@ class SmartStage:
     '''
     smart object that uses stages and readout to allow 'closed loop' operation
     '''
+    stream_readout = True #positions from the ARC200's continuous output
+    settle = 0.01 #after a burst, before the position counts (s)
+
     def __init__(self,Stages_port,Read_port,**kwargs):
         self.ANC300 = Stages(Stages_port,**kwargs)
         self.ARC200 = Readout(Read_port)
+        if self.stream_readout:
+            self.ARC200.start_stream()
 
     def check_input_pos(self,pos):
         if pos > 5 or pos < 0:
@@ -335,9 +603,11 @@ class SmartStage:
         while True:
             self.steps += 1
             self.move(axis,clicks)
-            if self.direction == -1 and self.ARC200.position(axis) <= pos:
+            #a reading from after the burst, not one from during it
+            self.curpos = self.ARC200.position(axis,time.time())
+            if self.direction == -1 and self.curpos <= pos:
                 break
-            if self.direction == 1 and self.ARC200.position(axis) >= pos:
+            if self.direction == 1 and self.curpos >= pos:
                 break
         #print 'I think I\'m there!'
         #print 'I am at',self.ARC200.position(axis),'in axis',axis
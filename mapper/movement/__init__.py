@@ -13,6 +13,9 @@ except:
 
 import time
 import random
+import numpy as np
+
+from simclock import clock as simulated
 
 def findClass(key=None):
 	index = {
@@ -28,6 +31,8 @@ def findClass(key=None):
 class Mover:
 	#superclass; features are vital for any controller implemented
 	#be it ANC300, ANC350, motor, or scanner
+	axes = 'xy' #axes moveTo takes; z-stacks need a z
+	clock = time #what waits are timed with; the fakes use the simulation clock
 	def __init__(self):
 		pass
 
@@ -40,6 +45,13 @@ class Mover:
 	def moveTo(self,axis,position):
 		print 'Not implemented: moveTo'
 
+	def moveToXY(self,x,y):
+		'''
+		moves to (x, y); movers that can move both axes at once do so
+		'''
+		self.moveTo('x',x)
+		self.moveTo('y',y)
+
 	def close(self):
 		print 'Not implemented: close'
 
@@ -47,6 +59,12 @@ class FakeMotor(Mover):
 	def __init__(self):
 		self.pos = {'x':2.5, 'y':2.5, 'z':2.5}
 	devicetype = 'Mm'
+	axes = 'xyz'
+	clock = simulated
+	move_latency = 0.5 #closed-loop move to a position (s)
+	step_latency = 0.1 #one burst of clicks (s)
+	click_size = 0.001 #mm per click
+	position_noise = 0.001 #mm
 	tests = {'m':	[[['xt','xf','yf','yt'],[0,5],'X/Y range(s) out of bounds'],
 							[['v'],[0.01,70],'Voltage out of bounds'],
 							[['f'],[1,1000],'Frequency out of bounds'],
@@ -54,7 +72,8 @@ class FakeMotor(Mover):
 							[['c'],[1,1000],'Clicks out of bounds']],
 			  'M':	[[['xt','xf','yf','yt'],[0,5],'X/Y range(s) out of bounds'],
 							[['vr'],[0,2],'Readout voltage out of bounds'],
-							[['n'],[2,1000],'Number of points out of bounds']]
+							[['n'],[2,1000],'Number of points out of bounds']],
+			  'zstack':	[[['zf','zt'],[0,5],'Z range out of bounds']]
 				}
 
 	def setDefaults(self,voltage,frequency,clicks,readvoltage):
@@ -75,18 +94,18 @@ class FakeMotor(Mover):
 			return self.pos
 
 	def moveUp(self,axis):
-		self.pos[axis] += self.clicks * 0.001 + random.gauss(0,0.001)
-		time.sleep(0.1)
+		self.pos[axis] += self.clicks * self.click_size + random.gauss(0,self.position_noise)
+		self.clock.sleep(self.step_latency)
 		return True
 
 	def moveDown(self,axis):
-		self.pos[axis] -= self.clicks * 0.001 + random.gauss(0,0.001)
-		time.sleep(0.1)
+		self.pos[axis] -= self.clicks * self.click_size + random.gauss(0,self.position_noise)
+		self.clock.sleep(self.step_latency)
 		return True
 
 	def moveTo(self,axis,position):
-		self.pos[axis] = position+random.gauss(0,0.001)
-		time.sleep(0.5)
+		self.pos[axis] = position+random.gauss(0,self.position_noise)
+		self.clock.sleep(self.move_latency)
 		return True
 
 class ANC300ARC200Motor(Mover):
@@ -95,6 +114,7 @@ class ANC300ARC200Motor(Mover):
 		self.device = SmartStage(*addresses)
 		self.pos = self.device.ARC200.position
 	devicetype = 'Mm'
+	axes = 'xyz'
 	tests = {'m':	[[['xt','xf','yf','yt'],[0,5],'X/Y range(s) out of bounds'],
 							[['v'],[0.01,70],'Voltage out of bounds'],
 							[['f'],[1,1000],'Frequency out of bounds'],
@@ -102,15 +122,15 @@ class ANC300ARC200Motor(Mover):
 							[['c'],[1,1000],'Clicks out of bounds']],
 			  'M':	[[['xt','xf','yf','yt'],[0,5],'X/Y range(s) out of bounds'],
 							[['vr'],[0,2],'Readout voltage out of bounds'],
-							[['n'],[2,1000],'Number of points out of bounds']]
+							[['n'],[2,1000],'Number of points out of bounds']],
+			  'zstack':	[[['zf','zt'],[0,5],'Z range out of bounds']]
 				}
 
 	def setDefaults(self,voltage,frequency,clicks,readvoltage):
 		self.voltage = voltage
 		self.frequency = frequency
 		for key in ['x','y']:
-			self.device.ANC300.set_voltage(key,voltage)
-			self.device.ANC300.set_frequency(key,frequency)
+			self.device.ANC300.set_drive(key,voltage,frequency)
 		self.clicks = int(clicks)
 		self.readvoltage = readvoltage #ARC200
 		print 'readvoltage not used'
@@ -121,8 +141,7 @@ class ANC300ARC200Motor(Mover):
 		self.frequency = frequency
 		self.voltage = 60
 		for key in ['x','y']:
-			self.device.ANC300.set_voltage(key,60)
-			self.device.ANC300.set_frequency(key,200)
+			self.device.ANC300.set_drive(key,60,200)
 
 
 	def getPos(self,axis=None):
@@ -140,11 +159,9 @@ class ANC300ARC200Motor(Mover):
 		return True
 
 	def moveTo(self,axis,position):
-		self.device.ANC300.set_voltage(axis,60)
-		self.device.ANC300.set_frequency(axis,200)
+		self.device.ANC300.set_drive(axis,60,200)
 		self.device.move_to(axis,position,100)
-		self.device.ANC300.set_voltage(axis,self.voltage)
-		self.device.ANC300.set_frequency(axis,self.frequency)
+		self.device.ANC300.set_drive(axis,self.voltage,self.frequency)
 		return True
 
 	def close(self):
@@ -153,6 +170,7 @@ class ANC300ARC200Motor(Mover):
 
 class LNAScanner(Mover):
 	def __init__(self,address='GPIB0::16'):
+		self.address = address
 		self.device = LockIn(address)
 		self.pos = {'x':self.device.query('DAC. '+str(self.device.aidmap['x'])),
 					'y':self.device.query('DAC. '+str(self.device.aidmap['y']))}
@@ -185,6 +203,33 @@ class LNAScanner(Mover):
 		self.pos[axis] = position
 		return True
 
+	def moveToXY(self,x,y):
+		#both DACs ramp together
+		self.device.ramp({'x':x,'y':y})
+		self.pos['x'] = x
+		self.pos['y'] = y
+		return True
+
+	fly_interval = 0.005 #curve buffer storage interval resolution (s)
+	def flyRow(self,axis,start,stop,duration,interval):
+		'''
+		sweeps axis from start to stop over duration while the lock-in
+		stores ADC1 in its curve buffer every interval; returns the position
+		and value of every sample, positions found from when each was taken
+		'''
+		interval = max(round(interval/self.fly_interval),1)*self.fly_interval
+		length = int(duration/interval)+1
+		started = self.device.start_curve(interval,length)
+		times, values = self.device.sweep(axis,start,stop,duration,interval)
+		deadline = time.time()+duration+1
+		while self.device.curve_points() < length and time.time() < deadline:
+			time.sleep(interval)
+		length = min(length,self.device.curve_points())
+		samples = np.array(self.device.read_curve(length))
+		positions = np.interp(started+interval*np.arange(length),times,values)
+		self.pos[axis] = stop
+		return positions, samples
+
 	def close(self):
 		self.device.close()
 
@@ -192,6 +237,10 @@ class FakeScanner(Mover):
 	def __init__(self):
 		self.pos = {'x':0,'y':0}
 	devicetype = 's'
+	clock = simulated
+	move_latency = 0.1 #DAC ramp to a position (s)
+	level = -0.8 #mean fly-scan reading
+	noise = 0.1 #its standard deviation
 	tests = {'s':	[[['xt','xf','yf','yt'],[0,10],'X/Y range(s) out of bounds'],
 					  		[['xv','yv'],[0,1],'X/Y step size out of bounds']]}
 
@@ -214,5 +263,18 @@ class FakeScanner(Mover):
 
 	def moveTo(self,axis,position):
 		self.pos[axis] = position
-		time.sleep(0.1)
-		return True
\ No newline at end of file
+		self.clock.sleep(self.move_latency)
+		return True
+
+	def moveToXY(self,x,y):
+		self.pos['x'] = x
+		self.pos['y'] = y
+		self.clock.sleep(self.move_latency)
+		return True
+
+	fly_interval = 0.001
+	def flyRow(self,axis,start,stop,duration,interval):
+		length = int(duration/interval)+1
+		self.clock.sleep(duration)
+		self.pos[axis] = stop
+		return np.linspace(start,stop,length), np.random.normal(self.level,self.noise,length)
\ No newline at end of file
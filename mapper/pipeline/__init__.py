@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+import Queue
+import time
+
+from simclock import clock
+
+def workersFor(*devices):
+	'''
+	returns one Worker per device; devices that share an address
+	(eg a scanner and measurer on the same lock-in) share a Worker,
+	so their calls are still made one after another
+	'''
+	by_address = {}
+	workers = []
+	for device in devices:
+		address = getattr(device,'address',None)
+		if address != None and address in by_address:
+			workers.append(by_address[address])
+		else:
+			workers.append(Worker())
+			if address != None:
+				by_address[address] = workers[-1]
+	return workers
+
+class Job:
+	'''
+	handle on a call queued on a Worker; result() blocks until it has run
+	and re-raises anything the call raised. On the simulation clock the
+	call starts no earlier than it was submitted, and whoever takes its
+	result is brought forward to when it finished
+	'''
+	def __init__(self,function,args):
+		self.function = function
+		self.args = args
+		self.done = threading.Event()
+		self.value = None
+		self.error = None
+		self.started_at = None
+		self.finished_at = None
+		self.submitted_on = clock.stamp() #on the simulation clock's timeline
+		self.finished_on = None
+
+	def run(self):
+		clock.catchUp(self.submitted_on)
+		self.started_at = time.time()
+		try:
+			self.value = self.function(*self.args)
+		except Exception as e:
+			self.error = e
+		self.finished_at = time.time()
+		self.finished_on = clock.stamp()
+		self.done.set()
+
+	def result(self):
+		self.done.wait()
+		clock.catchUp(self.finished_on)
+		if self.error != None:
+			raise self.error
+		return self.value
+
+class Signal:
+	'''
+	one-off event between threads, eg a detector's gate closing; wait()
+	blocks until it is set and, on the simulation clock, brings the waiter
+	forward to when it was set (only the first set counts)
+	'''
+	def __init__(self):
+		self.event = threading.Event()
+		self.set_on = 0.0
+
+	def set(self):
+		if not self.event.is_set():
+			self.set_on = clock.stamp()
+			self.event.set()
+
+	def wait(self):
+		self.event.wait()
+		clock.catchUp(self.set_on)
+
+class Worker(threading.Thread):
+	'''
+	runs queued calls for one instrument in order, on its own thread
+	'''
+	def __init__(self):
+		threading.Thread.__init__(self)
+		self.daemon = True
+		self.jobs = Queue.Queue()
+		self.start()
+
+	def submit(self,function,*args):
+		job = Job(function,args)
+		self.jobs.put(job)
+		return job
+
+	def run(self):
+		while True:
+			job = self.jobs.get()
+			if job == None:
+				break
+			job.run()
+
+	def stop(self):
+		'''
+		finishes anything already queued, then ends the thread
+		'''
+		self.jobs.put(None)
+		if self.is_alive() and threading.current_thread() != self:
+			self.join()
+			clock.catchUp(clock.stamp(self))
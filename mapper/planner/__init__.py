@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#per-point latencies (s) assumed for drivers with no history yet:
+#'move' is moving to a point and reading the position back,
+#'readout' is what a reading takes beyond its pause and measurement times
+default_latency = {'move':0.1,'readout':0.0}
+#weight given to the latest run when it is folded into the history
+history_weight = 0.5
+
+def gridSize(meas_par):
+	'''
+	(x_steps, y_steps) of the lattice a map works on, worked out as
+	MapperDrone.init does; None for open-loop maps, whose size is only
+	found while scanning
+	'''
+	if 'M' in meas_par['mtype']:
+		x_steps = meas_par['n']+1
+		y_steps = meas_par['n']+1
+	elif 's' in meas_par['mtype']:
+		x_steps = (abs(meas_par['xt']-meas_par['xf'])/meas_par['xv'])+1
+		y_steps = (abs(meas_par['yt']-meas_par['yf'])/meas_par['yv'])+1
+	else:
+		return None
+	if meas_par.get('adaptive'):
+		x_steps = int(round(x_steps-1))*2**meas_par['levels']+1
+		y_steps = int(round(y_steps-1))*2**meas_par['levels']+1
+	return int(x_steps), int(y_steps)
+
+def plannedPoints(meas_par):
+	'''
+	number of points a map will measure (for adaptive maps, the most it
+	can; for z-stacks, over all planes), or None if that is not known in
+	advance
+	'''
+	size = gridSize(meas_par)
+	if size == None:
+		return None
+	x_steps, y_steps = size
+	if meas_par.get('adaptive'):
+		stride = 2**meas_par['levels']
+		coarse = len(range(0,x_steps,stride))*len(range(0,y_steps,stride))
+		return max(coarse,min(meas_par['maxpoints'],x_steps*y_steps))
+	if meas_par.get('zstack'):
+		return x_steps*y_steps*int(meas_par['zn'])
+	return x_steps*y_steps
+
+def latency(history,name,phase):
+	return history.get(name,{}).get(phase,default_latency[phase])
+
+def estimateDuration(meas_par,history,mover,measurer,points):
+	'''
+	seconds to measure points, from the pause/measurement times and the
+	latencies recorded for the mover and measurer classes (by name)
+	'''
+	if meas_par.get('fly'):
+		#a sweep per row; the points themselves cost only their dwell
+		x_steps, y_steps = gridSize(meas_par)
+		return points*meas_par['tm'] + (points/float(x_steps))*(meas_par['tp']+2*latency(history,mover,'move'))
+	#several detectors read at the same time, so the slowest one counts
+	reading = meas_par['tp'] + meas_par['tm']
+	for channel in meas_par.get('channels',[])[1:]:
+		reading = max(reading,meas_par['tp_'+channel]+meas_par['tm_'+channel])
+	per_point = latency(history,mover,'move') + reading + latency(history,measurer,'readout')
+	return points*per_point
+
+def updateHistory(history,name,phase,value):
+	'''
+	folds the mean latency seen in one run into history[name][phase]
+	'''
+	entry = history.setdefault(name,{})
+	if phase in entry:
+		entry[phase] = (1-history_weight)*entry[phase] + history_weight*value
+	else:
+		entry[phase] = value
+
+def remainingTime(timestamps,remaining,window=50):
+	'''
+	seconds left for remaining points, at the rate of the last window
+	points; None until there are two to go on
+	'''
+	recent = timestamps[-window:]
+	if len(recent) < 2:
+		return None
+	return max(remaining,0)*(recent[-1]-recent[0])/(len(recent)-1)
+
+def formatDuration(seconds):
+	seconds = int(round(seconds))
+	if seconds >= 3600:
+		return '%d h %02d min' % (seconds//3600,(seconds%3600)//60)
+	elif seconds >= 60:
+		return '%d min %02d s' % (seconds//60,seconds%60)
+	return '%d s' % seconds
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import threading
+
+class Clock:
+	'''
+	time as the fake instruments see it; they wait with clock.sleep rather
+	than time.sleep. Every thread has a place on one shared timeline, moved
+	on by its own sleeps, and a thread that waits for another's work is
+	brought forward to where that work finished (catchUp, used by
+	pipeline's jobs and workers), so threads waiting side by side overlap
+	while a wait for another thread costs what that thread took. On a
+	virtual clock nothing is actually slept, so a scan runs as fast as the
+	Python around it while elapsed() still says how long the instruments
+	would have kept it busy. Real clocks sleep as time.sleep does (and keep
+	the timeline the same way), so the fakes can be watched at their real
+	pace
+	'''
+	def __init__(self,virtual=False):
+		self.virtual = virtual
+		self.lock = threading.Lock()
+		self.reset()
+
+	def setVirtual(self,virtual):
+		self.virtual = bool(virtual)
+
+	def reset(self):
+		'''
+		starts the timeline afresh, eg at the start of a scan
+		'''
+		with self.lock:
+			self.now = {}
+
+	def sleep(self,seconds):
+		if seconds <= 0:
+			return
+		with self.lock:
+			thread = threading.current_thread().ident
+			self.now[thread] = self.now.get(thread,0.0)+seconds
+		if not self.virtual:
+			time.sleep(seconds)
+
+	def stamp(self,thread=None):
+		'''
+		where a thread (this one if None) is on the timeline, in seconds
+		since the last reset
+		'''
+		if thread == None:
+			thread = threading.current_thread()
+		with self.lock:
+			return self.now.get(thread.ident,0.0)
+
+	def catchUp(self,stamp):
+		'''
+		brings this thread forward to stamp, eg once the work it waited
+		for, finished there by another thread, is done
+		'''
+		with self.lock:
+			thread = threading.current_thread().ident
+			self.now[thread] = max(self.now.get(thread,0.0),stamp)
+
+	def time(self):
+		'''
+		time.time() moved on by what this thread has slept virtually
+		'''
+		if not self.virtual:
+			return time.time()
+		return time.time()+self.stamp()
+
+	def elapsed(self):
+		'''
+		seconds the instruments kept the scan busy since the last reset:
+		the furthest any thread has got along the timeline
+		'''
+		with self.lock:
+			return max(self.now.values()+[0.0])
+
+#shared by all the fakes (iv-test's too); set virtual from the 'virtualclock' setting
+clock = Clock()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+class Volume:
+	'''
+	values of a z-stack, kept in a .npy file mapped into memory with shape
+	(channels, planes, y_steps, x_steps) and NaN until measured; points are
+	written straight into the file, so only the pages touched are held in
+	memory and what was measured is on disk if the program dies. Opened
+	read-only unless a shape is given, which creates the file afresh
+	'''
+	def __init__(self,path,shape=None):
+		self.path = path
+		if shape == None:
+			self.values = open_memmap(path,mode='r')
+		else:
+			self.values = open_memmap(path,mode='w+',dtype=float,shape=tuple(int(n) for n in shape))
+			self.values[...] = np.nan
+
+	def write(self,k,j,i,values):
+		'''
+		stores the values (one per channel) of point (i, j) of plane k
+		'''
+		self.values[:len(values),k,j,i] = values
+
+	def stack(self,channel=0):
+		'''
+		(planes, y_steps, x_steps) view of one channel
+		'''
+		return self.values[channel]
+
+	def flush(self):
+		if self.values.mode != 'r':
+			self.values.flush()
+
+	def close(self):
+		self.flush()
+		del self.values
+
+def sharpness(plane):
+	'''
+	per-pixel focus measure of one plane: the squared discrete Laplacian,
+	taking unmeasured neighbours as equal to the pixel itself
+	'''
+	padded = np.pad(plane,1,mode='edge')
+	centre = padded[1:-1,1:-1]
+	laplacian = np.zeros(plane.shape)
+	for shifted in [padded[:-2,1:-1],padded[2:,1:-1],padded[1:-1,:-2],padded[1:-1,2:]]:
+		laplacian += np.where(np.isnan(shifted),0.0,shifted-centre)
+	laplacian[np.isnan(plane)] = np.nan
+	return laplacian**2
+
+def bestFocus(stack):
+	'''
+	(image, plane index) per pixel of a (planes, y, x) stack, taking each
+	pixel from the plane where it is sharpest; the index is -1 (and the
+	value NaN) where no plane has been measured
+	'''
+	focus = np.array([sharpness(plane) for plane in stack])
+	measured = ~np.isnan(focus).all(axis=0)
+	focus[np.isnan(focus)] = -np.inf
+	index = focus.argmax(axis=0)
+	rows, cols = np.indices(index.shape)
+	image = np.where(measured,stack[index,rows,cols],np.nan)
+	return image, np.where(measured,index,-1)
+
+def sharpestPlane(stack):
+	'''
+	index of the plane with the highest mean sharpness, or None if none
+	has been measured
+	'''
+	scores = []
+	for plane in stack:
+		focus = sharpness(plane)
+		focus = focus[~np.isnan(focus)]
+		scores.append(focus.mean() if len(focus) > 0 else -np.inf)
+	if max(scores) == -np.inf:
+		return None
+	return int(np.argmax(scores))